@@ -1,7 +1,11 @@
 import discord
 from discord import app_commands
 from discord.ext import commands
+from dataclasses import dataclass
+from typing import Optional
 import aiohttp
+import asyncio
+import json
 import os
 import uuid
 import logging
@@ -9,35 +13,64 @@ import logging
 logging.basicConfig(level=logging.DEBUG, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
 logger = logging.getLogger("APIKeyCog")
 
+API_TIMEOUT = aiohttp.ClientTimeout(total=10, connect=3)  # Per request, so a dead API never hangs a command
+MAX_GET_RETRIES = 2  # Extra attempts for GETs, which are safe to repeat
+RETRY_BACKOFF = 0.5  # Seconds before the first retry, doubled after each one
+
+@dataclass
+class APIResponse:
+    """An API response read and parsed exactly once, safe to use after the connection is released."""
+    status: int
+    text: str
+    data: Optional[dict] = None  # Parsed JSON body, None if it wasn't valid JSON
+
+    @property
+    def ok(self):
+        return self.status == 200
+
 class APIKeyCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.session = aiohttp.ClientSession()
+        self.session = None
         self.bot_api_key = os.getenv("BOT_API_KEY")
         self.api_url = "http://localhost:5000"
 
+    async def cog_load(self):
+        # Created here so the session belongs to the bot's running loop, and its connections are reused
+        self.session = aiohttp.ClientSession(
+            headers={"X-API-Key": self.bot_api_key or ""},
+            connector=aiohttp.TCPConnector(limit=10),
+            timeout=API_TIMEOUT
+        )
+
     async def cog_unload(self):
         logger.debug("Closing aiohttp session")
         await self.session.close()
 
     async def _make_api_request(self, method, endpoint, data=None):
-        headers = {"X-API-Key": self.bot_api_key}
         url = f"{self.api_url}/{endpoint}"
-        logger.debug(f"Making {method} request to {url} with data: {data}, headers: {headers}")
-        
-        try:
-            timeout = aiohttp.ClientTimeout(total=10)  # Set a timeout to prevent hanging
-            async with self.session.request(method, url, headers=headers, json=data, timeout=timeout) as response:
-                logger.debug(f"Response status: {response.status}")
-                
-                # Read the response content regardless of status code
-                content = await response.text()
-                logger.debug(f"Response content: {content}")
-                
-                return response
-        except aiohttp.ClientError as e:
-            logger.error(f"Client error in API request: {str(e)}")
-            raise  # Re-raise to be handled by the calling function
+        attempts = 1 + (MAX_GET_RETRIES if method == "GET" else 0)
+        logger.debug(f"Making {method} request to {url} with data: {data}")
+
+        for attempt in range(attempts):
+            try:
+                async with self.session.request(method, url, json=data) as response:
+                    text = await response.text()
+                    logger.debug(f"Response status: {response.status}")
+                    logger.debug(f"Response content: {text}")
+                    if response.status < 500 or attempt == attempts - 1:
+                        try:
+                            parsed = json.loads(text)
+                        except ValueError:
+                            parsed = None
+                        return APIResponse(response.status, text, parsed if isinstance(parsed, dict) else None)
+                    logger.warning(f"Server error {response.status} from {url}, retrying")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt == attempts - 1:
+                    logger.error(f"Client error in API request: {str(e)}")
+                    raise  # Re-raise to be handled by the calling function
+                logger.warning(f"Client error in API request: {str(e)}, retrying")
+            await asyncio.sleep(RETRY_BACKOFF * 2 ** attempt)
 
     apikey_group = app_commands.Group(name="apikey", description="Manage API keys")
 
@@ -60,33 +93,29 @@ class APIKeyCog(commands.Cog):
             logger.debug("Deferred interaction response")
 
             response = await self._make_api_request("POST", "api_keys", data=data)
-            raw_response = await response.text()
-            logger.debug(f"Raw API response: {raw_response}")
 
-            if response.status == 200:
-                try:
-                    response_data = await response.json()
-                    logger.debug(f"Parsed API response: {response_data}")
-                    new_key = response_data.get("api_key")
+            if response.ok:
+                if response.data is not None:
+                    logger.debug(f"Parsed API response: {response.data}")
+                    new_key = response.data.get("api_key")
                     if not new_key:
                         new_key = str(uuid.uuid4())
                         logger.warning("API did not return a key; generated locally")
                     await interaction.followup.send(
                         f"Your new API key is: `{new_key}`", ephemeral=True
                     )
-                except aiohttp.ContentTypeError as e:
-                    logger.error(f"Failed to parse JSON: {str(e)}, raw response: {raw_response}")
+                else:
+                    logger.error(f"Failed to parse JSON, raw response: {response.text}")
                     await interaction.followup.send(
                         "API returned invalid JSON.", ephemeral=True
                     )
             elif response.status == 400:
-                try:
-                    response_data = await response.json()
-                    error_msg = response_data.get("error", "Bad request")
-                    logger.debug(f"400 error response: {response_data}")
+                if response.data is not None:
+                    error_msg = response.data.get("error", "Bad request")
+                    logger.debug(f"400 error response: {response.data}")
                     await interaction.followup.send(f"Error: {error_msg}", ephemeral=True)
-                except aiohttp.ContentTypeError:
-                    logger.error(f"Failed to parse 400 response: {raw_response}")
+                else:
+                    logger.error(f"Failed to parse 400 response: {response.text}")
                     await interaction.followup.send(
                         f"Error: Bad request (invalid response format)", ephemeral=True
                     )
@@ -98,7 +127,7 @@ class APIKeyCog(commands.Cog):
                 await interaction.followup.send("API server error occurred.", ephemeral=True)
             else:
                 await interaction.followup.send(f"API error: {response.status}", ephemeral=True)
-        except aiohttp.ClientError as e:
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
             logger.error(f"Network error: {str(e)}")
             await interaction.followup.send("Network error occurred.", ephemeral=True)
         except Exception as e:
@@ -115,10 +144,9 @@ class APIKeyCog(commands.Cog):
             
             response = await self._make_api_request("GET", f"api_keys/user/{user_id}")
             
-            if response.status == 200:
+            if response.ok:
                 try:
-                    response_data = await response.json()
-                    keys = response_data.get("keys", [])
+                    keys = (response.data or {}).get("keys", [])
                     
                     if not keys:
                         await interaction.followup.send("You don't have any API keys.", ephemeral=True)
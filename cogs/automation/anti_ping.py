@@ -2,72 +2,195 @@ import discord
 from discord.ext import commands
 from discord import app_commands
 from datetime import timedelta
+from cachetools import TTLCache
+import asyncio
 import json
 import os
 
+# One settings file per guild holding both the toggle and the protected users
+ANTI_PING_DIR = 'settings/anti_ping'
+FLUSH_DELAY = 5  # Seconds to collect changes before writing them to disk
+
+# Enforcement
+OFFENDER_WINDOW = 30  # Seconds during which repeat pings by the same offender are ignored
+WARNING_DELAY = 2  # Seconds to collect offenders before posting one warning per channel
+TIMEOUT_WORKERS = 3  # Timeouts applied concurrently
+
 class AutoMute(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.mute_duration = timedelta(minutes=5)
         self.settings_path = 'settings/'
+        self.dirty_guilds = set()  # Guilds with changes that haven't been written yet
+        self.flush_handle = None
+        self.recent_offenders = TTLCache(maxsize=10000, ttl=OFFENDER_WINDOW)  # (guild_id, user_id) already handled
+        self.enforcement_queue = asyncio.Queue()  # (member, channel) waiting to be timed out
+        self.enforcement_workers = []
+        self.pending_warnings = {}  # channel_id -> {"muted": [...], "forbidden": [...], "failed": [...]}
         self.load_all_settings()
 
+    async def cog_load(self):
+        self.enforcement_workers = [asyncio.create_task(self.enforcement_worker()) for _ in range(TIMEOUT_WORKERS)]
+
+    def cog_unload(self):
+        for worker in self.enforcement_workers:
+            worker.cancel()
+        if self.flush_handle:
+            self.flush_handle.cancel()
+        self.flush()
+
     def load_all_settings(self):
-        self.protected_users = self.load_json('ping_blacklist.json')
-        self.anti_ping_status = self.load_json('anti_ping_config.json')
+        self.guild_settings = {}  # guild_id (str) -> {"anti_ping_enabled": bool, "protected_users": [ids]}
+        if os.path.isdir(ANTI_PING_DIR):
+            for filename in os.listdir(ANTI_PING_DIR):
+                if filename.endswith('.json'):
+                    with open(os.path.join(ANTI_PING_DIR, filename), 'r') as f:
+                        self.guild_settings[filename[:-5]] = json.load(f)
+        else:
+            self.migrate_legacy_settings()
+
+        self.protected_index = {}  # guild_id -> frozenset of protected user IDs, checked on every message
+        for guild_id in self.guild_settings:
+            self.rebuild_protected_index(guild_id)
+
+    def migrate_legacy_settings(self):
+        """Fold the old ping_blacklist.json / anti_ping_config.json / config.json files into per-guild files."""
+        protected_users = self.load_json('ping_blacklist.json')
+        # Toggles used to be written to config.json but read from anti_ping_config.json
+        anti_ping_status = {**self.load_json('anti_ping_config.json'), **self.load_json('config.json')}
+        for guild_id, data in protected_users.items():
+            if isinstance(data, dict) and "protected_users" in data:
+                self.get_guild_settings(guild_id)["protected_users"] = list(data["protected_users"])
+        for guild_id, data in anti_ping_status.items():
+            if isinstance(data, dict) and "anti_ping_enabled" in data:
+                self.get_guild_settings(guild_id)["anti_ping_enabled"] = data["anti_ping_enabled"]
+        if self.guild_settings:
+            self.dirty_guilds.update(self.guild_settings)
+            self.flush()
+
+    def rebuild_protected_index(self, guild_id):
+        protected = self.guild_settings.get(str(guild_id), {}).get("protected_users", [])
+        if protected:
+            self.protected_index[int(guild_id)] = frozenset(protected)
+        else:
+            self.protected_index.pop(int(guild_id), None)
 
     def load_json(self, filename):
         filepath = os.path.join(self.settings_path, filename)
         try:
-            return json.load(open(filepath, 'r'))
+            with open(filepath, 'r') as f:
+                return json.load(f)
         except FileNotFoundError:
-            print(f"{filename} not found, creating an empty structure.")
             return {}
 
-    def save_json(self, data, filename):
-        filepath = os.path.join(self.settings_path, filename)
-        json.dump(data, open(filepath, 'w'), indent=4)
+    def mark_dirty(self, guild_id):
+        """Queue a guild's settings for writing, changes within FLUSH_DELAY share one write."""
+        self.dirty_guilds.add(str(guild_id))
+        if self.flush_handle is None:
+            self.flush_handle = self.bot.loop.call_later(FLUSH_DELAY, self.flush)
+
+    def flush(self):
+        self.flush_handle = None
+        if not self.dirty_guilds:
+            return
+        os.makedirs(ANTI_PING_DIR, exist_ok=True)
+        for guild_id in self.dirty_guilds:
+            filepath = os.path.join(ANTI_PING_DIR, f"{guild_id}.json")
+            tmp_path = f"{filepath}.tmp"
+            # Write to a temporary file first so a crash never leaves a half-written file
+            with open(tmp_path, 'w') as f:
+                json.dump(self.guild_settings[guild_id], f, indent=4)
+            os.replace(tmp_path, filepath)
+        self.dirty_guilds.clear()
 
     def get_guild_settings(self, guild_id):
-        guild_id_str = str(guild_id)
-        if guild_id_str not in self.protected_users:
-            self.protected_users[guild_id_str] = {"protected_users": []}
-        if guild_id_str not in self.anti_ping_status:
-            self.anti_ping_status[guild_id_str] = {"anti_ping_enabled": True}
+        return self.guild_settings.setdefault(str(guild_id), {"anti_ping_enabled": True, "protected_users": []})
 
     def add_protected_user(self, guild_id, user_id):
-        self.get_guild_settings(guild_id)
-        guild_id_str = str(guild_id)
-        if user_id not in self.protected_users[guild_id_str]["protected_users"]:
-            self.protected_users[guild_id_str]["protected_users"].append(user_id)
-            self.save_json(self.protected_users, 'ping_blacklist.json')
+        settings = self.get_guild_settings(guild_id)
+        if user_id not in settings["protected_users"]:
+            settings["protected_users"].append(user_id)
+            self.rebuild_protected_index(guild_id)
+            self.mark_dirty(guild_id)
+
+    def remove_protected_user(self, guild_id, user_id):
+        """Remove a user from the protected list, returns False if they weren't on it."""
+        protected = self.guild_settings.get(str(guild_id), {}).get("protected_users", [])
+        if user_id not in protected:
+            return False
+        protected.remove(user_id)
+        self.rebuild_protected_index(guild_id)
+        self.mark_dirty(guild_id)
+        return True
 
     def is_anti_ping_enabled(self, guild_id):
-        self.get_guild_settings(guild_id)
-        return self.anti_ping_status[str(guild_id)]["anti_ping_enabled"]
+        # Read-only, this runs for messages that ping protected users
+        return self.guild_settings.get(str(guild_id), {}).get("anti_ping_enabled", True)
 
     def set_anti_ping(self, guild_id, status):
-        self.get_guild_settings(guild_id)
-        self.anti_ping_status[str(guild_id)]["anti_ping_enabled"] = status
-        self.save_json(self.anti_ping_status, 'config.json')
+        settings = self.get_guild_settings(guild_id)
+        if settings["anti_ping_enabled"] != status:
+            settings["anti_ping_enabled"] = status
+            self.mark_dirty(guild_id)
 
     @commands.Cog.listener()
     async def on_message(self, message):
-        if message.author == self.bot.user or not message.guild:
+        # Most messages mention nobody, bail out before touching any settings
+        if not message.raw_mentions or not message.guild:
+            return
+        protected = self.protected_index.get(message.guild.id)
+        if not protected or protected.isdisjoint(message.raw_mentions):
+            return
+        if message.author == self.bot.user or not self.is_anti_ping_enabled(message.guild.id):
             return
-        if not self.is_anti_ping_enabled(message.guild.id):
+        # Webhook messages (like the chat bot's replies) have no member behind them to time out
+        if message.webhook_id or not isinstance(message.author, discord.Member):
             return
-        guild_id_str = str(message.guild.id)
-        protected_users = self.protected_users.get(guild_id_str, {}).get("protected_users", [])
-        for user in message.mentions:
-            if user.id in protected_users:
-                try:
-                    await message.author.timeout(self.mute_duration, reason="Pinging a user")
-                    await message.channel.send(f"{message.author.mention} You are not allowed to ping this user.")
-                except discord.Forbidden:
-                    await message.channel.send(f"I don't have permission to timeout {message.author.mention}.")
-                except discord.HTTPException:
-                    await message.channel.send(f"Failed to mute {message.author.mention} due to an error.")
+
+        # One action per offender no matter how many protected users or messages they ping
+        key = (message.guild.id, message.author.id)
+        if key in self.recent_offenders:
+            return
+        self.recent_offenders[key] = True
+        self.enforcement_queue.put_nowait((message.author, message.channel))
+
+    async def enforcement_worker(self):
+        while True:
+            member, channel = await self.enforcement_queue.get()
+            try:
+                await member.timeout(self.mute_duration, reason="Pinging a user")
+                outcome = "muted"
+            except discord.Forbidden:
+                outcome = "forbidden"
+            except discord.HTTPException:
+                outcome = "failed"
+            except Exception as e:
+                # Keep the worker alive whatever goes wrong with a single member
+                print(f"Error timing out {member.id}: {e}")
+                outcome = "failed"
+            self.queue_warning(channel, outcome, member.mention)
+
+    def queue_warning(self, channel, outcome, mention):
+        """Collect offenders per channel so a burst of pings produces a single warning message."""
+        pending = self.pending_warnings.get(channel.id)
+        if pending is None:
+            pending = self.pending_warnings[channel.id] = {"muted": [], "forbidden": [], "failed": []}
+            self.bot.loop.call_later(WARNING_DELAY, lambda: asyncio.create_task(self.send_warnings(channel)))
+        pending[outcome].append(mention)
+
+    async def send_warnings(self, channel):
+        pending = self.pending_warnings.pop(channel.id)
+        lines = []
+        if pending["muted"]:
+            lines.append(f"{', '.join(pending['muted'])} You are not allowed to ping this user.")
+        if pending["forbidden"]:
+            lines.append(f"I don't have permission to timeout {', '.join(pending['forbidden'])}.")
+        if pending["failed"]:
+            lines.append(f"Failed to mute {', '.join(pending['failed'])} due to an error.")
+        try:
+            await channel.send("\n".join(lines)[:2000], allowed_mentions=discord.AllowedMentions(users=True))
+        except discord.HTTPException as e:
+            print(f"Failed to send anti-ping warning in {channel.id}: {e}")
 
     anti_ping = app_commands.Group(name="anti_ping", description="Manage anti-ping settings")
 
@@ -80,13 +203,10 @@ class AutoMute(commands.Cog):
     @anti_ping.command(name="remove_protected")
     @commands.has_permissions(administrator=True)
     async def remove_protected(self, interaction: discord.Interaction, user: discord.Member):
-        guild_id = str(interaction.guild.id)
-        if guild_id in self.protected_users and user.id in self.protected_users[guild_id]:
-            self.protected_users[guild_id].remove(user.id)
-            self.save_json(self.protected_users, 'ping_blacklist.json')
-            await interaction.send(f"{user.mention} has been removed from the protected list.")
+        if self.remove_protected_user(interaction.guild.id, user.id):
+            await interaction.response.send_message(f"{user.mention} has been removed from the protected list.")
         else:
-            await interaction.send(f"{user.mention} is not on the protected list.")
+            await interaction.response.send_message(f"{user.mention} is not on the protected list.")
 
     @anti_ping.command(name="toggle_anti_ping")
     @commands.has_permissions(administrator=True)
@@ -1,15 +1,25 @@
 import discord
 from discord import app_commands
-from discord.ext import commands
+from discord.ext import commands, tasks
 import openai
 import os
-import requests
 from dotenv import load_dotenv
+import aiohttp
 import asyncio
+import gzip
+import hashlib
 import json
 import logging
+import re
+import time
 from cachetools import TTLCache
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+from collections import OrderedDict
 from datetime import datetime, timedelta
+from pathlib import Path
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -17,20 +27,478 @@ logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 WEBHOOK_URL = os.getenv("DISCORD_WEBHOOK_URL")  # Store webhook URL in .env
 
-# Initialize cache (TTL: 1 hour)
-cache = TTLCache(maxsize=100, ttl=3600)
+# Response cache shared by every user (TTL: 1 hour)
+RESPONSE_CACHE_SIZE = 500
+RESPONSE_CACHE_TTL = 3600
+
+def normalize_prompt(prompt, bot_user_id=None):
+    """Lowercase a prompt and trim surrounding whitespace and trailing ?!. for its cache key.
+
+    Symbols inside the prompt are kept, "c++" and "c#" are different questions. Only the
+    bot's own mention is dropped, other mentions stay part of the prompt since the answer
+    is about whoever they point at."""
+    if bot_user_id is not None:
+        prompt = prompt.replace(f"<@{bot_user_id}>", " ").replace(f"<@!{bot_user_id}>", " ")
+    return prompt.lower().strip().rstrip("?!.").rstrip()
+
+class ResponseCache:
+    """Answers to stateless questions, keyed by a hash of the normalized prompt."""
+
+    def __init__(self):
+        self.answers = TTLCache(maxsize=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(normalized):
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+    def get(self, prompt, bot_user_id=None):
+        answer = self.answers.get(self.key(normalize_prompt(prompt, bot_user_id)))
+        if answer is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return answer
+
+    def put(self, prompt, answer, bot_user_id=None):
+        self.answers[self.key(normalize_prompt(prompt, bot_user_id))] = answer
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.answers),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
 
 # Token limit for conversation history
 MAX_TOKENS = 4000
-SUMMARIZE_THRESHOLD = 3000
+SUMMARIZE_THRESHOLD = 3000  # Summarizing starts in the background past this many tokens
+KEEP_RECENT_MESSAGES = 4  # Latest messages kept verbatim when the rest is summarized
+MESSAGE_TOKEN_OVERHEAD = 4  # Tokens the chat format adds around each message
+
+def load_encoding():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model("gpt-4o")
+    except Exception as e:
+        logger.warning(f"Could not load tokenizer, falling back to estimated token counts: {e}")
+        return None
+
+ENCODING = load_encoding()
+
+def count_tokens(message):
+    """Count the tokens a chat message takes up in a prompt."""
+    content = message["content"]
+    if ENCODING is not None:
+        return len(ENCODING.encode(content)) + MESSAGE_TOKEN_OVERHEAD
+    return len(content) // 4 + 1 + MESSAGE_TOKEN_OVERHEAD  # Roughly four characters per token
+
+class Conversation:
+    """A user's message history with a running token count.
+
+    Each message is counted once when it is added, so checking the size of the history
+    never has to walk or serialize it."""
+    __slots__ = ("messages", "tokens", "summary_task", "last_active")
+
+    def __init__(self, system_prompt):
+        self.messages = [system_prompt]
+        self.tokens = count_tokens(system_prompt)
+        self.summary_task = None  # Background summarization, if one is running
+        self.last_active = time.time()
+
+    def append(self, message):
+        self.messages.append(message)
+        self.tokens += count_tokens(message)
+        self.last_active = time.time()
+
+    def pop(self):
+        message = self.messages.pop()
+        self.tokens -= count_tokens(message)
+        return message
+
+    def trim(self, limit):
+        """Drop the oldest messages after the system prompt until the history fits in `limit`."""
+        while self.tokens > limit and len(self.messages) > 2:
+            self.tokens -= count_tokens(self.messages.pop(1))
+
+    def replace_with_summary(self, summarized, summary):
+        """Swap the summarized messages for a single summary, keeping anything added since."""
+        summarized_ids = {id(message) for message in summarized}
+        self.messages = [
+            self.messages[0],
+            {"role": "system", "content": f"Conversation summary: {summary}"},
+        ] + [message for message in self.messages[1:] if id(message) not in summarized_ids]
+        self.tokens = sum(count_tokens(message) for message in self.messages)
+
+# Conversation storage
+CONVERSATION_DIR = Path("settings/chat_history")
+MAX_CACHED_CONVERSATIONS = 500  # Conversations kept in memory, the rest live on disk
+CONVERSATION_TTL = 7 * 24 * 3600  # Seconds of inactivity before a conversation is forgotten
+
+class ConversationStore:
+    """Conversations held in memory up to MAX_CACHED_CONVERSATIONS.
+
+    The least recently used are written to a gzipped JSON file per user when the cap is
+    hit and loaded again on that user's next message. Conversations idle for longer
+    than CONVERSATION_TTL are dropped from memory and disk."""
+
+    def __init__(self, system_prompt, is_busy):
+        self.system_prompt = system_prompt
+        self.is_busy = is_busy  # Conversations with a request in flight are never evicted
+        self.cached = OrderedDict()  # user_id -> Conversation, least recently used first
+
+    def path(self, user_id):
+        return CONVERSATION_DIR / f"{user_id}.json.gz"
+
+    def get(self, user_id):
+        """Return a user's conversation, rehydrating it from disk or starting a new one."""
+        conversation = self.cached.get(user_id)
+        if conversation is not None:
+            self.cached.move_to_end(user_id)
+            return conversation
+        conversation = self.load(user_id) or Conversation(self.system_prompt)
+        self.cached[user_id] = conversation
+        self.evict()
+        return conversation
+
+    def delete(self, user_id):
+        self.cached.pop(user_id, None)
+        self.path(user_id).unlink(missing_ok=True)
+
+    def evict(self):
+        for user_id in list(self.cached):
+            if len(self.cached) <= MAX_CACHED_CONVERSATIONS:
+                break
+            if not self.is_busy(user_id):
+                self.save(user_id, self.cached.pop(user_id))
+
+    def expire(self):
+        """Forget conversations that have been idle for longer than CONVERSATION_TTL."""
+        cutoff = time.time() - CONVERSATION_TTL
+        for user_id, conversation in list(self.cached.items()):
+            if conversation.last_active < cutoff and not self.is_busy(user_id):
+                del self.cached[user_id]
+        if CONVERSATION_DIR.exists():
+            for path in CONVERSATION_DIR.glob("*.json.gz"):
+                if path.stat().st_mtime < cutoff:
+                    path.unlink(missing_ok=True)
+
+    def flush(self):
+        for user_id, conversation in self.cached.items():
+            self.save(user_id, conversation)
+
+    def save(self, user_id, conversation):
+        CONVERSATION_DIR.mkdir(parents=True, exist_ok=True)
+        path = self.path(user_id)
+        tmp_path = path.with_suffix(".tmp")
+        data = {
+            "last_active": conversation.last_active,
+            # The system prompt is the same for everyone, so it isn't stored
+            "messages": [[message["role"], message["content"]] for message in conversation.messages[1:]],
+        }
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        tmp_path.replace(path)
+
+    def load(self, user_id):
+        path = self.path(user_id)
+        if not path.exists():
+            return None
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Error loading conversation for user {user_id}: {e}")
+            return None
+        if data["last_active"] < time.time() - CONVERSATION_TTL:
+            path.unlink(missing_ok=True)
+            return None
+        conversation = Conversation(self.system_prompt)
+        for role, content in data["messages"]:
+            conversation.append({"role": role, "content": content})
+        conversation.last_active = data["last_active"]
+        return conversation
+
+# Chat triggers
+TRIGGER_SETTINGS_PATH = "settings/chat_triggers.json"
+DEFAULT_TRIGGER_KEYWORDS = ["glazer", "idothehax glazer"]
+DEFAULT_USER_COOLDOWN = 10  # Seconds for a user to earn back one trigger
+MAX_USER_COOLDOWN = 3600
+TRIGGER_BURST = 2  # Triggers a user can spend back to back
+
+class TriggerEngine:
+    """Decides which messages reach the chat bot, before any network work is done.
+
+    Each guild has its own keywords (matched as whole words with one compiled pattern),
+    an optional channel allowlist and a per-user cooldown. Cooldowns are token buckets
+    so a user can ask a couple of quick follow-ups but not spam the API."""
+
+    def __init__(self):
+        self.settings = self.load_settings()
+        self.patterns = {}  # guild_id -> compiled keyword pattern
+        self.user_tokens = TTLCache(maxsize=10000, ttl=MAX_USER_COOLDOWN * TRIGGER_BURST)
+
+    def load_settings(self):
+        try:
+            with open(TRIGGER_SETTINGS_PATH, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def save_settings(self):
+        os.makedirs(os.path.dirname(TRIGGER_SETTINGS_PATH), exist_ok=True)
+        with open(TRIGGER_SETTINGS_PATH, 'w') as f:
+            json.dump(self.settings, f, indent=4)
+
+    def get_guild_settings(self, guild_id):
+        return self.settings.get(str(guild_id), {})
+
+    def update_guild_settings(self, guild_id, **changes):
+        self.settings.setdefault(str(guild_id), {}).update(changes)
+        self.patterns.pop(guild_id, None)
+        self.save_settings()
+
+    def get_pattern(self, guild_id):
+        pattern = self.patterns.get(guild_id)
+        if pattern is None:
+            keywords = self.get_guild_settings(guild_id).get("keywords", DEFAULT_TRIGGER_KEYWORDS)
+            if keywords:
+                # Longest first so multi-word keywords win over their prefixes
+                alternatives = "|".join(re.escape(keyword) for keyword in sorted(keywords, key=len, reverse=True))
+                pattern = re.compile(rf"\b(?:{alternatives})\b", re.IGNORECASE)
+            else:
+                pattern = False  # Mentions only
+            self.patterns[guild_id] = pattern
+        return pattern
+
+    def should_respond(self, message, bot_user_id):
+        guild_id = message.guild.id if message.guild else None
+        settings = self.get_guild_settings(guild_id) if guild_id else {}
+
+        channels = settings.get("channels")
+        if channels and message.channel.id not in channels:
+            return False
+
+        if bot_user_id not in message.raw_mentions:
+            pattern = self.get_pattern(guild_id)
+            if not pattern or not pattern.search(message.content):
+                return False
+
+        return self.take_token(message.author.id, settings.get("cooldown", DEFAULT_USER_COOLDOWN))
+
+    def take_token(self, user_id, cooldown):
+        """Spend one of the user's trigger tokens, refilling one every `cooldown` seconds."""
+        now = time.monotonic()
+        tokens, last = self.user_tokens.get(user_id, (TRIGGER_BURST, now))
+        if cooldown:
+            tokens = min(TRIGGER_BURST, tokens + (now - last) / cooldown)
+        else:
+            tokens = TRIGGER_BURST
+        if tokens < 1:
+            self.user_tokens[user_id] = (tokens, now)
+            return False
+        self.user_tokens[user_id] = (tokens - 1, now)
+        return True
+
+# Request scheduling
+MAX_CONCURRENT_REQUESTS = 4  # OpenAI calls in flight across all users
+MAX_PENDING_PER_USER = 3  # Questions a single user may have queued at once
+
+# Streaming replies
+STREAM_EDIT_INTERVAL = 1.0  # Minimum seconds between edits of a streamed reply
+DISCORD_MESSAGE_LIMIT = 2000
+
+# Webhook delivery
+WEBHOOK_BATCH_WINDOW = 0.5  # Seconds to wait for more plain messages to batch together
+WEBHOOK_MAX_RETRIES = 5
+WEBHOOK_TIMEOUT = aiohttp.ClientTimeout(total=30)  # Per webhook request, a hung request would hold up the whole queue
+
+class WebhookJob:
+    __slots__ = ("kind", "content", "username", "message", "future")
+
+    def __init__(self, kind, content, username=None, message=None, future=None):
+        self.kind = kind  # "send" or "edit"
+        self.content = content
+        self.username = username
+        self.message = message  # Message to edit, for "edit" jobs
+        self.future = future  # Resolved with the sent message when the caller needs it
+
+class WebhookDelivery:
+    """Queue plus background worker that delivers every chat bot message through the webhook.
+
+    Callers never wait on HTTP unless they ask for the sent message. Plain messages queued
+    close together are merged, repeated edits of one message collapse into the newest, and
+    failed requests are retried with backoff. discord.Webhook already paces requests by the
+    X-RateLimit headers, a 429 that still gets through is retried after its Retry-After."""
+
+    def __init__(self, url):
+        self.url = url
+        self.queue = asyncio.Queue()
+        self.session = None
+        self.webhook = None
+        self.worker = None
+
+    async def start(self):
+        # One pooled session for every webhook request this cog makes
+        self.session = aiohttp.ClientSession(timeout=WEBHOOK_TIMEOUT)
+        if self.url:
+            self.webhook = discord.Webhook.from_url(self.url, session=self.session)
+        self.worker = asyncio.create_task(self.run())
+
+    async def close(self):
+        self.worker.cancel()
+        await asyncio.gather(self.worker, return_exceptions=True)
+        # Nothing will deliver the queued jobs now, release anyone waiting on a sent message
+        while not self.queue.empty():
+            job = self.queue.get_nowait()
+            if job.future is not None and not job.future.done():
+                job.future.set_result(None)
+        await self.session.close()
+
+    def send(self, content, username):
+        """Queue a message without waiting for it to be delivered."""
+        self.queue.put_nowait(WebhookJob("send", content, username=username))
+
+    async def send_and_wait(self, content, username):
+        """Queue a message and wait for the sent message, or None if it could not be delivered."""
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait(WebhookJob("send", content, username=username, future=future))
+        return await future
+
+    def edit(self, message, content):
+        self.queue.put_nowait(WebhookJob("edit", content, message=message))
+
+    async def run(self):
+        while True:
+            job = await self.queue.get()
+            if job.kind == "send" and job.future is None:
+                await asyncio.sleep(WEBHOOK_BATCH_WINDOW)
+            jobs = [job]
+            while not self.queue.empty():
+                jobs.append(self.queue.get_nowait())
+            jobs = self.merge(jobs)
+            try:
+                for job in jobs:
+                    try:
+                        await self.deliver(job)
+                    except Exception as e:
+                        # Never let one bad job take the worker, and with it every later reply, down
+                        logger.error(f"Error delivering webhook job: {e}")
+            finally:
+                # Also runs when the worker is cancelled mid-batch, so no caller waits forever
+                for job in jobs:
+                    if job.future is not None and not job.future.done():
+                        job.future.set_result(None)
+
+    def merge(self, jobs):
+        """Combine plain sends that fit in one message and keep only the last edit per message."""
+        last_edit = {id(job.message): job for job in jobs if job.kind == "edit"}
+        merged = []
+        for job in jobs:
+            if job.kind == "edit":
+                if last_edit[id(job.message)] is job:
+                    merged.append(job)
+                continue
+            previous = merged[-1] if merged else None
+            if (job.future is None and previous is not None and previous.kind == "send"
+                    and previous.future is None and previous.username == job.username
+                    and len(previous.content) + len(job.content) + 1 <= DISCORD_MESSAGE_LIMIT):
+                previous.content = f"{previous.content}\n{job.content}"
+            else:
+                merged.append(job)
+        return merged
+
+    async def deliver(self, job):
+        message = None
+        if self.webhook is None:
+            logger.error("Error sending to webhook: DISCORD_WEBHOOK_URL is not set")
+        else:
+            for attempt in range(WEBHOOK_MAX_RETRIES):
+                try:
+                    if job.kind == "send":
+                        message = await self.webhook.send(job.content, username=job.username, wait=job.future is not None)
+                        logger.info("Message sent to Discord webhook")
+                    else:
+                        await job.message.edit(content=job.content)
+                    break
+                except discord.HTTPException as e:
+                    if e.status != 429 and e.status < 500:
+                        logger.error(f"Error sending to webhook: {e}")
+                        break
+                    retry_after = e.response.headers.get("Retry-After") if e.response is not None else None
+                    wait_time = float(retry_after) if retry_after else 2 ** attempt
+                    logger.warning(f"Webhook request failed ({e.status}), retrying in {wait_time}s")
+                    await asyncio.sleep(wait_time)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    logger.warning(f"Webhook connection error, retrying in {2 ** attempt}s: {e}")
+                    await asyncio.sleep(2 ** attempt)
+            else:
+                logger.error("Error sending to webhook: max retries exceeded")
+        if job.future is not None and not job.future.done():
+            job.future.set_result(message)
+
+class StreamingReply:
+    """A webhook message that is edited in place as a streamed answer arrives."""
+
+    def __init__(self, cog, prefix, username="IDoTheHax Glazer"):
+        self.cog = cog
+        self.prefix = prefix
+        self.username = username
+        self.parts = []
+        self.message = None  # The webhook message, once the first text has been sent
+        self.sending = None  # Task delivering the first text, never awaited while streaming
+        self.last_edit = 0.0
+        self.shown = None
+
+    async def feed(self, delta):
+        """Add a streamed token, editing the reply at most once per STREAM_EDIT_INTERVAL.
+
+        None means the request is being retried and the text so far should be dropped."""
+        if delta is None:
+            self.parts = []
+            return
+        self.parts.append(delta)
+        if time.monotonic() - self.last_edit >= STREAM_EDIT_INTERVAL:
+            await self.show("".join(self.parts))
+
+    async def finish(self, text):
+        """Show the complete answer, or send it in one go if nothing was streamed."""
+        if self.sending is not None:
+            # Called after the OpenAI slot was released, so waiting here holds up nobody else
+            await self.sending
+        if self.message is None:
+            self.cog.send_to_discord(f"{self.prefix} {text}", username=self.username)
+        else:
+            await self.show(text)
+
+    async def show(self, text):
+        content = f"{self.prefix} {text}"[:DISCORD_MESSAGE_LIMIT]
+        if content == self.shown:
+            return
+        self.last_edit = time.monotonic()
+        self.shown = content
+        if self.message is not None:
+            self.cog.delivery.edit(self.message, content)
+        elif self.sending is None:
+            # feed runs while the OpenAI slot is held, so the first send goes on in the
+            # background. Text that arrives before it lands is picked up by send_first.
+            self.sending = asyncio.create_task(self.send_first(content))
+
+    async def send_first(self, content):
+        self.message = await self.cog.delivery.send_and_wait(content, self.username)
+        if self.message is not None and self.shown != content:
+            self.cog.delivery.edit(self.message, self.shown)
 
 class ChatGPTCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.conversation_histories = {}  # User-specific conversation histories
         self.system_prompt = {
             "role": "system",
             "content": (
@@ -39,42 +507,123 @@ class ChatGPTCog(commands.Cog):
                 "Respond in a friendly, engaging tone, and provide concise, relevant answers. "
             )
         }
-        self.lock = asyncio.Lock()  # Lock for thread-safe operations
+        self.user_locks = {}  # user_id -> asyncio.Lock, keeps each user's history in order
+        self.user_pending = {}  # user_id -> number of queued or running requests
+        self.request_semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)  # Global cap on API calls
+        self.client = openai.AsyncOpenAI(api_key=OPENAI_API_KEY)
+        self.delivery = WebhookDelivery(WEBHOOK_URL)
+        self.response_cache = ResponseCache()
+        self.triggers = TriggerEngine()
+        self.conversations = ConversationStore(self.system_prompt, is_busy=lambda user_id: user_id in self.user_pending)
+
+    async def cog_load(self):
+        await self.delivery.start()
+        self.expire_conversations.start()
+
+    async def cog_unload(self):
+        self.expire_conversations.cancel()
+        self.conversations.flush()  # Keep context across reloads and restarts
+        await self.delivery.close()
+        await self.client.close()
+
+    @tasks.loop(hours=1)
+    async def expire_conversations(self):
+        self.conversations.expire()
+
+    async def schedule_request(self, user_id, prompt, timeout=None, on_delta=None):
+        """Queue a question for a user and wait for the answer.
 
-    async def ask_chatgpt(self, user_id, prompt, max_retries=3):
-        """Handle OpenAI API calls with exponential backoff and caching."""
-        cache_key = f"{user_id}:{prompt[:50]}"  # Create a unique cache key
-        if cache_key in cache:
-            logger.info(f"Cache hit for user {user_id}")
-            return cache[cache_key]
+        Requests from one user run one at a time so their history stays ordered, while
+        different users share the global semaphore (which hands out slots first come,
+        first served). Returns None if the request was cancelled because `timeout` ran out."""
+        pending = self.user_pending.get(user_id, 0)
+        if pending >= MAX_PENDING_PER_USER:
+            return "You already have a few questions waiting, please wait for those to be answered first."
 
-        # Initialize user-specific history if not exists
-        if user_id not in self.conversation_histories:
-            self.conversation_histories[user_id] = [self.system_prompt]
+        self.user_pending[user_id] = pending + 1
+        lock = self.user_locks.setdefault(user_id, asyncio.Lock())
+
+        async def run():
+            async with lock:
+                return await self.ask_chatgpt(user_id, prompt, on_delta=on_delta)
+
+        try:
+            return await asyncio.wait_for(run(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Request for user {user_id} cancelled, interaction expired")
+            return None
+        finally:
+            self.user_pending[user_id] -= 1
+            if not self.user_pending[user_id]:
+                del self.user_pending[user_id]
+                del self.user_locks[user_id]
+
+    async def ask_chatgpt(self, user_id, prompt, max_retries=3, on_delta=None):
+        """Handle OpenAI API calls with exponential backoff and caching.
+
+        If `on_delta` is given it is awaited with each streamed piece of the answer, and with
+        None when a retry throws away what was streamed so far."""
+        # Get the user's history, loading it from disk if it was evicted
+        conversation = self.conversations.get(user_id)
+
+        # Only questions asked without prior context have answers that can be shared
+        cacheable = len(conversation.messages) == 1
+        if cacheable:
+            cached_answer = self.response_cache.get(prompt, self.bot.user.id)
+            if cached_answer is not None:
+                logger.info(f"Cache hit for user {user_id}")
+                conversation.append({"role": "user", "content": prompt})
+                conversation.append({"role": "assistant", "content": cached_answer})
+                return cached_answer
 
         # Add user prompt to history
-        self.conversation_histories[user_id].append({"role": "user", "content": prompt})
+        user_message = {"role": "user", "content": prompt}
+        conversation.append(user_message)
 
-        # Summarize history if it exceeds token threshold
-        await self.summarize_history(user_id)
+        # A summary normally keeps the history well below the limit, if one hasn't landed
+        # in time the oldest messages are dropped instead of making the user wait for it
+        conversation.trim(MAX_TOKENS)
 
+        try:
+            return await self.request_completion(user_id, conversation, prompt if cacheable else None, max_retries, on_delta)
+        except asyncio.CancelledError:
+            # Drop the unanswered prompt so a cancelled request doesn't linger in the history
+            if conversation.messages[-1] is user_message:
+                conversation.pop()
+            raise
+
+    async def request_completion(self, user_id, conversation, cache_prompt, max_retries, on_delta):
         for attempt in range(max_retries):
             try:
-                async with self.lock:
-                    response = await asyncio.to_thread(
-                        openai.chat.completions.create,
+                parts = []
+                if attempt and on_delta:
+                    await on_delta(None)  # Start the reply over instead of appending to the failed attempt
+                async with self.request_semaphore:
+                    stream = await self.client.chat.completions.create(
                         model="gpt-4o",  # Use a more efficient model (check OpenAI's latest models)
-                        messages=self.conversation_histories[user_id],
+                        messages=conversation.messages,
                         max_tokens=500,  # Limit response length
-                        temperature=0.7
+                        temperature=0.7,
+                        stream=True
                     )
+                    async for chunk in stream:
+                        delta = chunk.choices[0].delta.content if chunk.choices else None
+                        if delta:
+                            parts.append(delta)
+                            if on_delta:
+                                await on_delta(delta)
+
+                assistant_message = "".join(parts)
+                conversation.append({"role": "assistant", "content": assistant_message})
 
-                assistant_message = response.choices[0].message.content
-                self.conversation_histories[user_id].append({"role": "assistant", "content": assistant_message})
+                # Summarize ahead of the limit, off the reply path
+                if conversation.tokens > SUMMARIZE_THRESHOLD and conversation.summary_task is None:
+                    conversation.summary_task = asyncio.create_task(self.summarize_history(user_id, conversation))
 
                 # Cache the response
-                cache[cache_key] = assistant_message
-                logger.info(f"Response cached for user {user_id}")
+                if cache_prompt is not None:
+                    self.response_cache.put(cache_prompt, assistant_message, self.bot.user.id)
+                    logger.info(f"Response cached for user {user_id}")
                 return assistant_message
 
             except openai.RateLimitError as e:
@@ -87,39 +636,33 @@ class ChatGPTCog(commands.Cog):
 
         return "Error: Max retries exceeded due to rate limits."
 
-    async def summarize_history(self, user_id):
-        """Summarize conversation history if it exceeds token threshold."""
-        history = self.conversation_histories[user_id]
-        if len(json.dumps(history)) > SUMMARIZE_THRESHOLD:
-            try:
-                summary_prompt = (
-                    "Summarize the following conversation into a concise paragraph, retaining key context:\n"
-                    f"{json.dumps(history[1:])}"  # Exclude system prompt
-                )
-                summary_response = await asyncio.to_thread(
-                    openai.chat.completions.create,
+    async def summarize_history(self, user_id, conversation):
+        """Summarize older conversation history in the background once it passes the threshold."""
+        summarized = conversation.messages[1:-KEEP_RECENT_MESSAGES]  # Exclude system prompt and recent turns
+        try:
+            if not summarized:
+                return
+            summary_prompt = (
+                "Summarize the following conversation into a concise paragraph, retaining key context:\n"
+                f"{json.dumps(summarized)}"
+            )
+            async with self.request_semaphore:
+                summary_response = await self.client.chat.completions.create(
                     model="gpt-4o",
                     messages=[{"role": "user", "content": summary_prompt}],
                     max_tokens=200
                 )
-                summary = summary_response.choices[0].message.content
-                self.conversation_histories[user_id] = [
-                    self.system_prompt,
-                    {"role": "system", "content": f"Conversation summary: {summary}"}
-                ]
-                logger.info(f"Conversation history summarized for user {user_id}")
-            except Exception as e:
-                logger.error(f"Error summarizing history: {e}")
+            summary = summary_response.choices[0].message.content
+            conversation.replace_with_summary(summarized, summary)
+            logger.info(f"Conversation history summarized for user {user_id}")
+        except Exception as e:
+            logger.error(f"Error summarizing history: {e}")
+        finally:
+            conversation.summary_task = None
 
     def send_to_discord(self, message, username="IDoTheHax Glazer"):
-        """Send message via webhook."""
-        try:
-            data = {"content": message, "username": username}
-            response = requests.post(WEBHOOK_URL, json=data)
-            response.raise_for_status()
-            logger.info("Message sent to Discord webhook")
-        except requests.RequestException as e:
-            logger.error(f"Error sending to webhook: {e}")
+        """Queue a message for the webhook, delivery happens in the background."""
+        self.delivery.send(message[:DISCORD_MESSAGE_LIMIT], username)
 
     @commands.Cog.listener()
     async def on_message(self, message):
@@ -127,30 +670,93 @@ class ChatGPTCog(commands.Cog):
         if message.author.bot:
             return
 
-        # Check for bot mention or keywords
-        keywords = ["chat", "question", "glazer", "IDoTheHax glazer", "bot"]
-        if self.bot.user.mentioned_in(message) or any(keyword in message.content.lower() for keyword in keywords):
+        # Check for bot mention or keywords, channel allowlist and the user's cooldown
+        if self.triggers.should_respond(message, self.bot.user.id):
             async with message.channel.typing():
-                response = await self.ask_chatgpt(message.author.id, message.content)
-                self.send_to_discord(f"{message.author.mention} {response}")
+                reply = StreamingReply(self, message.author.mention)
+                response = await self.schedule_request(message.author.id, message.content, on_delta=reply.feed)
+                await reply.finish(response)
 
         await self.bot.process_commands(message)  # Process commands after message handling
 
+    chatbot = app_commands.Group(name="chatbot", description="Configure when the chat bot responds")
+
+    @chatbot.command(name="add_keyword", description="Respond to messages containing this word or phrase")
+    @app_commands.checks.has_permissions(manage_guild=True)
+    async def add_keyword(self, interaction: discord.Interaction, keyword: str):
+        keywords = self.triggers.get_guild_settings(interaction.guild.id).get("keywords", DEFAULT_TRIGGER_KEYWORDS)
+        keyword = keyword.strip().lower()
+        if keyword in keywords:
+            await interaction.response.send_message(f"`{keyword}` is already a trigger keyword.", ephemeral=True)
+            return
+        self.triggers.update_guild_settings(interaction.guild.id, keywords=keywords + [keyword])
+        await interaction.response.send_message(f"Added `{keyword}` as a trigger keyword.", ephemeral=True)
+
+    @chatbot.command(name="remove_keyword", description="Stop responding to this word or phrase")
+    @app_commands.checks.has_permissions(manage_guild=True)
+    async def remove_keyword(self, interaction: discord.Interaction, keyword: str):
+        keywords = self.triggers.get_guild_settings(interaction.guild.id).get("keywords", DEFAULT_TRIGGER_KEYWORDS)
+        keyword = keyword.strip().lower()
+        if keyword not in keywords:
+            await interaction.response.send_message(f"`{keyword}` is not a trigger keyword.", ephemeral=True)
+            return
+        self.triggers.update_guild_settings(interaction.guild.id, keywords=[k for k in keywords if k != keyword])
+        await interaction.response.send_message(f"Removed `{keyword}` from the trigger keywords.", ephemeral=True)
+
+    @chatbot.command(name="allow_channel", description="Only respond in the allowed channels")
+    @app_commands.checks.has_permissions(manage_guild=True)
+    async def allow_channel(self, interaction: discord.Interaction, channel: discord.TextChannel):
+        channels = self.triggers.get_guild_settings(interaction.guild.id).get("channels", [])
+        if channel.id not in channels:
+            self.triggers.update_guild_settings(interaction.guild.id, channels=channels + [channel.id])
+        await interaction.response.send_message(f"The chat bot will respond in {channel.mention}.", ephemeral=True)
+
+    @chatbot.command(name="disallow_channel", description="Remove a channel from the allowed channels")
+    @app_commands.checks.has_permissions(manage_guild=True)
+    async def disallow_channel(self, interaction: discord.Interaction, channel: discord.TextChannel):
+        channels = self.triggers.get_guild_settings(interaction.guild.id).get("channels", [])
+        if channel.id not in channels:
+            await interaction.response.send_message(f"{channel.mention} is not an allowed channel.", ephemeral=True)
+            return
+        self.triggers.update_guild_settings(interaction.guild.id, channels=[c for c in channels if c != channel.id])
+        await interaction.response.send_message(f"Removed {channel.mention} from the allowed channels.", ephemeral=True)
+
+    @chatbot.command(name="set_cooldown", description="Seconds before a user can trigger the chat bot again")
+    @app_commands.checks.has_permissions(manage_guild=True)
+    async def set_trigger_cooldown(self, interaction: discord.Interaction, seconds: app_commands.Range[int, 0, MAX_USER_COOLDOWN]):
+        self.triggers.update_guild_settings(interaction.guild.id, cooldown=seconds)
+        await interaction.response.send_message(f"Chat bot cooldown set to {seconds} seconds.", ephemeral=True)
+
     @app_commands.command(name="ask", description="Ask IDoTheHax Glazer a question")
     async def ask_command(self, interaction: discord.Interaction, question: str):
         """Slash command to ask a question."""
         await interaction.response.defer(thinking=True)
-        response = await self.ask_chatgpt(interaction.user.id, question)
-        self.send_to_discord(f"{interaction.user.mention} {response}")
+        # Give up once the interaction token expires, nobody is waiting for the answer anymore
+        timeout = (interaction.expires_at - discord.utils.utcnow()).total_seconds()
+        reply = StreamingReply(self, interaction.user.mention)
+        response = await self.schedule_request(interaction.user.id, question, timeout=timeout, on_delta=reply.feed)
+        if response is None:
+            return
+        await reply.finish(response)
         await interaction.followup.send("Response sent!", ephemeral=True)
 
+    @app_commands.command(name="chat_stats", description="Show response cache statistics for the chat bot")
+    async def chat_stats_command(self, interaction: discord.Interaction):
+        """Slash command to show how often answers come from the cache."""
+        stats = self.response_cache.stats()
+        embed = discord.Embed(title="Chat Bot Cache", color=discord.Color.blue())
+        embed.add_field(name="Cached answers", value=str(stats["entries"]))
+        embed.add_field(name="Hits", value=str(stats["hits"]))
+        embed.add_field(name="Misses", value=str(stats["misses"]))
+        embed.add_field(name="Hit rate", value=f"{stats['hit_rate']:.0%}")
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
     @app_commands.command(name="reset", description="Reset your conversation history")
     async def reset_command(self, interaction: discord.Interaction):
         """Slash command to reset conversation history."""
         await interaction.response.defer(ephemeral=True)
-        if interaction.user.id in self.conversation_histories:
-            del self.conversation_histories[interaction.user.id]
-            logger.info(f"Conversation history reset for user {interaction.user.id}")
+        self.conversations.delete(interaction.user.id)
+        logger.info(f"Conversation history reset for user {interaction.user.id}")
         await interaction.followup.send("Your conversation history has been reset!", ephemeral=True)
 
 async def setup(bot):
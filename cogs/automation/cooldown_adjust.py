@@ -1,15 +1,69 @@
 import discord
 from discord.ext import commands, tasks
-from collections import defaultdict
-from datetime import datetime, timedelta
+from array import array
+from collections import deque
+import asyncio
 import json
 import os
+import time
+
+ACTIVITY_WINDOW = 60  # Seconds of history kept per channel, one counter per second
+
+# Default (messages per minute, slow mode seconds) ladder, highest first.
+# Guilds and channels with /set_cooldown settings use their own single step instead.
+DEFAULT_LADDER = ((50, 10), (30, 5), (10, 3))
+
+EWMA_ALPHA = 0.5  # Weight of the latest minute in the smoothed rate
+HYSTERESIS_RATIO = 0.7  # Slow mode is only lowered once the rate drops below this share of a threshold
+
+MAX_CONCURRENT_EDITS = 5
+EDIT_BUDGET = 3  # Slow mode edits allowed per channel...
+EDIT_BUDGET_WINDOW = 600  # ...within this many seconds
+
+class ChannelActivity:
+    """Rolling per-second message counters for a single channel.
+
+    Memory is fixed at one ring of ACTIVITY_WINDOW counters and the running
+    total makes reading the messages-per-minute rate O(1)."""
+    __slots__ = ("buckets", "head", "total", "smoothed", "edits")
+
+    def __init__(self, now):
+        self.buckets = array('I', [0]) * ACTIVITY_WINDOW
+        self.head = now  # The second the newest bucket belongs to
+        self.total = 0
+        self.smoothed = 0.0  # EWMA of messages per minute, updated once per policy pass
+        self.edits = deque()  # Times of recent slow mode edits, for the edit budget
+
+    def advance(self, now):
+        """Roll the ring forward to `now`, clearing buckets that fell out of the window."""
+        elapsed = now - self.head
+        if elapsed <= 0:
+            return
+        if elapsed >= ACTIVITY_WINDOW:
+            self.buckets = array('I', [0]) * ACTIVITY_WINDOW
+            self.total = 0
+        else:
+            for second in range(self.head + 1, now + 1):
+                index = second % ACTIVITY_WINDOW
+                self.total -= self.buckets[index]
+                self.buckets[index] = 0
+        self.head = now
+
+    def record(self, now):
+        self.advance(now)
+        self.buckets[now % ACTIVITY_WINDOW] += 1
+        self.total += 1
+
+    def messages_per_minute(self, now):
+        self.advance(now)
+        return self.total
 
 class CooldownManager(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.channel_activity = defaultdict(list)  # Stores message timestamps per channel
+        self.channel_activity = {}  # channel_id -> ChannelActivity
         self.cooldown_settings_path = 'settings/cooldown_manager.json'
+        self.cooldown_settings = self.load_all_cooldown_settings()  # Cached, updated by /set_cooldown
         self.update_cooldown.start()  # Starts the task to check and update cooldowns
 
     def cog_unload(self):
@@ -21,70 +75,114 @@ class CooldownManager(commands.Cog):
         if message.author.bot or not message.guild:
             return
 
-        # Add the message's timestamp to the list for the corresponding channel
-        self.channel_activity[message.channel.id].append(datetime.utcnow())
+        # Count the message in the current second's bucket for this channel
+        now = int(time.monotonic())
+        activity = self.channel_activity.get(message.channel.id)
+        if activity is None:
+            activity = self.channel_activity[message.channel.id] = ChannelActivity(now)
+        activity.record(now)
 
     @tasks.loop(minutes=1)
     async def update_cooldown(self):
         """Task that runs every minute to check activity and adjust cooldown."""
-        now = datetime.utcnow()
+        now = int(time.monotonic())
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_EDITS)
+        edits = []
 
-        for channel_id, timestamps in self.channel_activity.items():
-            # Remove messages older than 1 minute
-            self.channel_activity[channel_id] = [ts for ts in timestamps if now - ts < timedelta(minutes=1)]
+        for channel_id, activity in list(self.channel_activity.items()):
+            channel = self.bot.get_channel(channel_id)
+            if channel is None:
+                del self.channel_activity[channel_id]
+                continue
 
-            # Calculate messages per minute in this channel
-            messages_per_minute = len(self.channel_activity[channel_id])
+            # Smooth the per-minute rate so a single burst doesn't flip slow mode back and forth
+            messages_per_minute = activity.messages_per_minute(now)
+            activity.smoothed = EWMA_ALPHA * messages_per_minute + (1 - EWMA_ALPHA) * activity.smoothed
 
             # Determine the slow mode based on activity
-            cooldown = self.calculate_cooldown(messages_per_minute)
-
-            # Get the channel object
-            channel = self.bot.get_channel(channel_id)
-            if channel and channel.slowmode_delay != cooldown:  # Only edit if cooldown has changed
+            ladder = self.get_ladder(channel)
+            cooldown = self.calculate_cooldown(activity.smoothed, channel.slowmode_delay, ladder)
+
+            if channel.slowmode_delay != cooldown:  # Only edit if cooldown has changed
+                if self.take_edit_budget(activity, now):
+                    edits.append(self.apply_cooldown(channel, cooldown, semaphore))
+            elif messages_per_minute == 0 and cooldown == 0:
+                # Idle channel with slow mode already off, stop tracking it
+                del self.channel_activity[channel_id]
+
+        if edits:
+            await asyncio.gather(*edits)
+
+    async def apply_cooldown(self, channel, cooldown, semaphore):
+        async with semaphore:
+            try:
                 await channel.edit(slowmode_delay=cooldown)
                 print(f"Updated slow mode in {channel.name} to {cooldown} seconds.")
-
-    def calculate_cooldown(self, messages_per_minute):
-        """Determine the cooldown (slow mode) based on the number of messages per minute."""
-        if messages_per_minute > 50:
-            return 10  # High activity -> 10 seconds cooldown
-        elif messages_per_minute > 30:
-            return 5   # Medium activity -> 5 seconds cooldown
-        elif messages_per_minute > 10:
-            return 3   # Low activity -> 3 seconds cooldown
-        else:
-            return 0   # Very low activity -> No cooldown
+            except discord.HTTPException as e:
+                print(f"Failed to update slow mode in {channel.name}: {e}")
+
+    def take_edit_budget(self, activity, now):
+        """Spend one slow mode edit from the channel's budget, if any is left."""
+        while activity.edits and now - activity.edits[0] >= EDIT_BUDGET_WINDOW:
+            activity.edits.popleft()
+        if len(activity.edits) >= EDIT_BUDGET:
+            return False
+        activity.edits.append(now)
+        return True
+
+    def get_ladder(self, channel):
+        """Resolve the channel's thresholds: channel settings, then guild settings, then the defaults."""
+        guild_settings = self.cooldown_settings.get(str(channel.guild.id))
+        if not guild_settings:
+            return DEFAULT_LADDER
+        settings = guild_settings.get("channels", {}).get(str(channel.id), guild_settings)
+        if "threshold" not in settings:
+            return DEFAULT_LADDER
+        return ((settings["threshold"], settings["cooldown"]),)
+
+    def calculate_cooldown(self, messages_per_minute, current_cooldown=0, ladder=DEFAULT_LADDER):
+        """Determine the cooldown (slow mode) based on the number of messages per minute.
+
+        Raising the cooldown uses the ladder thresholds as-is, lowering it requires the rate
+        to fall below HYSTERESIS_RATIO of them, so the value doesn't flap around a threshold."""
+        def lookup(ratio):
+            for threshold, cooldown in ladder:
+                if messages_per_minute > threshold * ratio:
+                    return cooldown
+            return 0  # Very low activity -> No cooldown
+
+        raised = lookup(1.0)
+        if raised > current_cooldown:
+            return raised
+        return min(current_cooldown, lookup(HYSTERESIS_RATIO))
+
+    def load_all_cooldown_settings(self):
+        """Load every guild's cooldown settings from the JSON file."""
+        try:
+            with open(self.cooldown_settings_path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
 
     async def save_cooldown_settings(self, guild_id, settings):
         """Save the cooldown settings for the specified guild to a JSON file."""
+        self.cooldown_settings[guild_id] = settings
         try:
-            if os.path.exists(self.cooldown_settings_path):
-                with open(self.cooldown_settings_path, 'r') as f:
-                    data = json.load(f)
-            else:
-                data = {}
-
-            data[guild_id] = settings
-
+            os.makedirs(os.path.dirname(self.cooldown_settings_path), exist_ok=True)
             with open(self.cooldown_settings_path, 'w') as f:
-                json.dump(data, f, indent=4)
+                json.dump(self.cooldown_settings, f, indent=4)
 
         except Exception as e:
             print(f"Error saving cooldown settings: {e}")
 
     def load_cooldown_settings(self, guild_id):
-        """Load the cooldown settings for the specified guild from a JSON file."""
-        try:
-            with open(self.cooldown_settings_path, 'r') as f:
-                data = json.load(f)
-                return data.get(guild_id)
-        except FileNotFoundError:
-            return None
+        """Get the cached cooldown settings for the specified guild."""
+        return self.cooldown_settings.get(guild_id)
 
     @discord.app_commands.command(name="set_cooldown", description="Set the cooldown settings for this guild.")
-    async def set_cooldown(self, interaction: discord.Interaction, cooldown: int, threshold: int):
-        """Set the cooldown time and threshold for the guild."""
+    @discord.app_commands.describe(channel="Only apply these settings to this channel (optional)")
+    async def set_cooldown(self, interaction: discord.Interaction, cooldown: int, threshold: int, channel: discord.TextChannel = None):
+        """Set the cooldown time and threshold for the guild or one of its channels."""
         guild_id = str(interaction.guild.id)
 
         settings = {
@@ -92,8 +190,15 @@ class CooldownManager(commands.Cog):
             'threshold': threshold
         }
 
-        await self.save_cooldown_settings(guild_id, settings)
-        await interaction.response.send_message(f"Cooldown settings updated:\nCooldown: {cooldown}\nThreshold: {threshold}")
+        guild_settings = dict(self.load_cooldown_settings(guild_id) or {})
+        if channel:
+            guild_settings.setdefault('channels', {})[str(channel.id)] = settings
+        else:
+            guild_settings.update(settings)
+
+        await self.save_cooldown_settings(guild_id, guild_settings)
+        target = f" for {channel.mention}" if channel else ""
+        await interaction.response.send_message(f"Cooldown settings updated{target}:\nCooldown: {cooldown}\nThreshold: {threshold}")
 
     @discord.app_commands.command(name="get_cooldown", description="Get the current cooldown settings for this guild.")
     async def get_cooldown(self, interaction: discord.Interaction):
@@ -102,11 +207,13 @@ class CooldownManager(commands.Cog):
         cooldown_settings = self.load_cooldown_settings(guild_id)
 
         if cooldown_settings:
-            await interaction.response.send_message(
-                f"Current cooldown settings for this guild:\n"
-                f"Cooldown Time: {cooldown_settings['cooldown']}\n"
-                f"Threshold: {cooldown_settings['threshold']}"
-            )
+            lines = ["Current cooldown settings for this guild:"]
+            if 'threshold' in cooldown_settings:
+                lines.append(f"Cooldown Time: {cooldown_settings['cooldown']}")
+                lines.append(f"Threshold: {cooldown_settings['threshold']}")
+            for channel_id, channel_settings in cooldown_settings.get('channels', {}).items():
+                lines.append(f"<#{channel_id}>: Cooldown Time: {channel_settings['cooldown']}, Threshold: {channel_settings['threshold']}")
+            await interaction.response.send_message("\n".join(lines))
         else:
             await interaction.response.send_message("No cooldown settings found for this guild. Please set them first.")
 
@@ -3,35 +3,76 @@ from discord.ext import commands
 import json
 import os
 
+DISABLED_COMMANDS_PATH = 'settings/disabled_commands.json'
+FLUSH_DELAY = 5  # Seconds to collect changes before writing them to disk
+ALWAYS_ENABLED = frozenset({"shush", "unshush"})  # Never lock moderators out of undoing a shush
+
 class CommandControl(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.disabled_commands = self.load_disabled_commands()
+        self.disabled_commands = self.load_disabled_commands()  # guild_id -> frozenset of command names
+        self.flush_handle = None
+        self.original_interaction_check = None
+
+    async def cog_load(self):
+        # Every app command interaction passes through the tree's check before it is dispatched
+        self.original_interaction_check = self.bot.tree.interaction_check
+        self.bot.tree.interaction_check = self.check_disabled_command
+
+    def cog_unload(self):
+        self.bot.tree.interaction_check = self.original_interaction_check
+        if self.flush_handle:
+            self.flush_handle.cancel()
+            self.save_disabled_commands()
+
+    async def check_disabled_command(self, interaction: discord.Interaction) -> bool:
+        if interaction.guild_id is not None and interaction.type == discord.InteractionType.application_command:
+            disabled = self.disabled_commands.get(interaction.guild_id)
+            if disabled and interaction.command is not None:
+                names = {interaction.data.get("name"), interaction.command.qualified_name}
+                if not disabled.isdisjoint(names):
+                    await interaction.response.send_message("This command has been disabled in this server.", ephemeral=True)
+                    return False
+        return await self.original_interaction_check(interaction)
 
     def load_disabled_commands(self):
         try:
-            with open('settings/disabled_commands.json', 'r') as f:
-                return json.load(f)
+            with open(DISABLED_COMMANDS_PATH, 'r') as f:
+                data = json.load(f)
         except FileNotFoundError:
             print("disabled_commands.json not found, creating an empty config.")
             return {}
+        return {int(guild_id): frozenset(names) for guild_id, names in data.items() if names}
 
     def save_disabled_commands(self):
-        with open('settings/disabled_commands.json', 'w') as f:
-            json.dump(self.disabled_commands, f, indent=4)
+        self.flush_handle = None
+        os.makedirs(os.path.dirname(DISABLED_COMMANDS_PATH), exist_ok=True)
+        data = {str(guild_id): sorted(names) for guild_id, names in self.disabled_commands.items()}
+        tmp_path = f"{DISABLED_COMMANDS_PATH}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, indent=4)
+        os.replace(tmp_path, DISABLED_COMMANDS_PATH)
 
     def get_disabled_commands_for_guild(self, guild_id):
-        return self.disabled_commands.get(str(guild_id), set())
+        return self.disabled_commands.get(guild_id, frozenset())
 
     def update_disabled_commands_for_guild(self, guild_id, commands_set):
-        self.disabled_commands[str(guild_id)] = list(commands_set)
-        self.save_disabled_commands()
+        if commands_set:
+            self.disabled_commands[guild_id] = frozenset(commands_set)
+        else:
+            self.disabled_commands.pop(guild_id, None)
+        # Changes within FLUSH_DELAY of each other share one write
+        if self.flush_handle is None:
+            self.flush_handle = self.bot.loop.call_later(FLUSH_DELAY, self.save_disabled_commands)
+
+    def get_command_names(self):
+        """Names of every registered command, read from the bot's local command tree."""
+        return {command.qualified_name for command in self.bot.tree.walk_commands()}
 
     @discord.app_commands.command(name="shush", description="Disable a specific command (for moderators)")
     @commands.has_permissions(administrator=True)
     async def shush(self, ctx, command_name: str):
         guild_id = ctx.guild.id
-        all_commands = await self.bot.tree.fetch_commands()
 
         if command_name == 'anti_ping':
             auto_mute_cog = self.bot.get_cog('AutoMute')
@@ -40,13 +81,14 @@ class CommandControl(commands.Cog):
                 await ctx.response.send_message(f"The `anti_ping` functionality has been disabled.")
             return
 
-        if command_name in [cmd.name for cmd in all_commands]:
+        if command_name in ALWAYS_ENABLED:
+            await ctx.response.send_message(f"The `{command_name}` command can't be disabled.")
+        elif command_name in self.get_command_names():
             disabled_commands = self.get_disabled_commands_for_guild(guild_id)
             if command_name in disabled_commands:
                 await ctx.response.send_message(f"The `{command_name}` command is already disabled.")
             else:
-                disabled_commands.add(command_name)
-                self.update_disabled_commands_for_guild(guild_id, disabled_commands)
+                self.update_disabled_commands_for_guild(guild_id, disabled_commands | {command_name})
                 await ctx.response.send_message(f"The `{command_name}` command has been disabled.")
         else:
             await ctx.response.send_message("No such command found.")
@@ -65,8 +107,7 @@ class CommandControl(commands.Cog):
 
         disabled_commands = self.get_disabled_commands_for_guild(guild_id)
         if command_name in disabled_commands:
-            disabled_commands.remove(command_name)
-            self.update_disabled_commands_for_guild(guild_id, disabled_commands)
+            self.update_disabled_commands_for_guild(guild_id, disabled_commands - {command_name})
             await ctx.response.send_message(f"The `{command_name}` command has been re-enabled.")
         else:
             await ctx.response.send_message("No such command is currently disabled.")
@@ -1,52 +1,200 @@
 import discord
 from discord.ext import commands
+from pathlib import Path
+import asyncio
+import json
+import logging
+
+# Directory where the per-guild auto mode setting is stored, the hoister index itself is
+# rebuilt from the member cache on startup so it can't miss changes made while offline
+ANTI_HOIST_DIR = Path("settings/anti_hoist")
+
+HOISTING_CHARS = ('!', '"', '#', '$', '%', '&', "'", '(', ')', '*', '+', ',', '.', '/', ':', ';', '<', '=', '>', '?', '@', '[', '\\', ']', '^', '_', '`', '{', '|', '}', '~')
+HOISTING_STR = ''.join(HOISTING_CHARS)
+FALLBACK_NICK = "Dehoisted"  # Used when nothing is left after stripping
+
+# Renames are sent in small concurrent batches with a pause in between so a
+# large dehoist does not eat the bot's whole rate limit budget
+RENAME_BATCH_SIZE = 5
+RENAME_BATCH_DELAY = 1.0
+
+logger = logging.getLogger(__name__)
+
+def is_hoisting(member):
+    return not member.bot and member.display_name.startswith(HOISTING_CHARS)
 
 class AntiHoist(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.guild_states = {}  # guild_id -> {"auto_dehoist": bool, "indexed": bool, "hoisters": set}
+        self.pending_renames = {}  # guild_id -> set of member IDs waiting to be renamed
+        self.rename_workers = {}  # guild_id -> asyncio.Task draining pending_renames
+
+    async def cog_load(self):
+        # On a reload the guilds are already cached and on_guild_available won't fire again
+        if self.bot.is_ready():
+            for guild in self.bot.guilds:
+                self.build_index(guild)
+
+    def cog_unload(self):
+        for worker in self.rename_workers.values():
+            worker.cancel()
+
+    def get_guild_state(self, guild_id):
+        """Return the cached hoister index for a guild, loading its auto mode setting on first use."""
+        state = self.guild_states.get(guild_id)
+        if state is None:
+            state = {"auto_dehoist": False, "indexed": False, "hoisters": set()}
+            state_file = ANTI_HOIST_DIR / f"{guild_id}.json"
+            if state_file.exists():
+                with open(state_file, "r") as file:
+                    state["auto_dehoist"] = json.load(file).get("auto_dehoist", False)
+            self.guild_states[guild_id] = state
+        return state
+
+    def save_guild_state(self, guild_id):
+        ANTI_HOIST_DIR.mkdir(parents=True, exist_ok=True)
+        state_file = ANTI_HOIST_DIR / f"{guild_id}.json"
+        tmp_file = state_file.with_suffix(".tmp")
+        with open(tmp_file, "w") as file:
+            json.dump({"auto_dehoist": self.guild_states[guild_id]["auto_dehoist"]}, file)
+        tmp_file.replace(state_file)
+
+    def update_index(self, member):
+        """Track or untrack a member in the guild's hoister index.
+
+        Returns True if the member is currently hoisting."""
+        state = self.get_guild_state(member.guild.id)
+        hoisting = is_hoisting(member)
+        if hoisting:
+            state["hoisters"].add(member.id)
+        else:
+            state["hoisters"].discard(member.id)
+        return hoisting
+
+    def build_index(self, guild):
+        """Scan the cached members to seed the guild's index, later changes come from member events.
+
+        With auto mode on, hoisters who joined or renamed while the bot was offline are queued too."""
+        state = self.get_guild_state(guild.id)
+        state["hoisters"] = {member.id for member in guild.members if is_hoisting(member)}
+        state["indexed"] = True
+        if state["auto_dehoist"] and state["hoisters"]:
+            self.schedule_renames(guild, state["hoisters"])
+
+    @commands.Cog.listener()
+    async def on_guild_available(self, guild):
+        self.build_index(guild)
+
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild):
+        self.build_index(guild)
+
+    def schedule_renames(self, guild, member_ids):
+        """Queue members for renaming and make sure a worker is draining the queue."""
+        self.pending_renames.setdefault(guild.id, set()).update(member_ids)
+        worker = self.rename_workers.get(guild.id)
+        if worker is None or worker.done():
+            worker = self.bot.loop.create_task(self.rename_worker(guild))
+            self.rename_workers[guild.id] = worker
+        return worker
+
+    async def rename_worker(self, guild):
+        """Rename queued hoisters in paced batches until the queue is empty."""
+        results = {"found": 0, "renamed": 0, "failed": 0}
+        pending = self.pending_renames[guild.id]
+        try:
+            while pending:
+                batch = [pending.pop() for _ in range(min(RENAME_BATCH_SIZE, len(pending)))]
+                outcomes = await asyncio.gather(*(self.dehoist_member(guild, member_id) for member_id in batch))
+                for outcome in outcomes:
+                    if outcome is not None:
+                        results["found"] += 1
+                        results["renamed" if outcome else "failed"] += 1
+                if pending:
+                    await asyncio.sleep(RENAME_BATCH_DELAY)
+        finally:
+            if not pending:
+                self.pending_renames.pop(guild.id, None)
+        return results
+
+    async def dehoist_member(self, guild, member_id):
+        """Strip leading hoisting characters from a member's name.
+
+        Returns None if the member is no longer hoisting, otherwise whether the rename worked."""
+        member = guild.get_member(member_id)
+        if member is None or not is_hoisting(member):
+            self.get_guild_state(guild.id)["hoisters"].discard(member_id)
+            return None
+
+        new_nick = member.display_name.lstrip(HOISTING_STR).strip() or FALLBACK_NICK
+        try:
+            await member.edit(nick=new_nick, reason="Dehoisted")
+        except (discord.Forbidden, discord.HTTPException) as e:
+            logger.warning(f"Failed to dehoist {member_id} in guild {guild.id}: {e}")
+            return False
+        # on_member_update removes the member from the index once the nick change lands
+        return True
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member):
+        if self.update_index(member) and self.get_guild_state(member.guild.id)["auto_dehoist"]:
+            self.schedule_renames(member.guild, [member.id])
+
+    @commands.Cog.listener()
+    async def on_member_update(self, before, after):
+        if before.display_name == after.display_name:
+            return
+        if self.update_index(after) and self.get_guild_state(after.guild.id)["auto_dehoist"]:
+            self.schedule_renames(after.guild, [after.id])
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member):
+        self.get_guild_state(member.guild.id)["hoisters"].discard(member.id)
 
     @discord.app_commands.command(name="dehoist", description="Renames users with hoisting nicknames")
     @discord.app_commands.checks.has_permissions(moderate_members=True, manage_nicknames=True)
     async def dehoist(self, interaction: discord.Interaction):
-        hoisting_chars = ('!', '"', '#', '$', '%', '&', "'", '(', ')', '*', '+', ',', '.', '/', ':', ';', '<', '=', '>', '?', '@', '[', '\\', ']', '^', '_', '`', '{', '|', '}', '~')
-        hoisting_str = ''.join(hoisting_chars)  # Convert tuple to string
-        hoisters_found = []
-        hoisters_renamed = []
-        failed_renames = []
-
-        # Check all members in the guild
-        for member in interaction.guild.members:
-            # Skip bots and members without hoisting nicknames
-            if member.bot or not member.nick:
-                continue
-
-            # Check if the nickname starts with a hoisting character
-            if member.nick.startswith(hoisting_chars):
-                hoisters_found.append(member)
-
-                # Attempt to rename the member by removing leading hoisting characters
-                new_nick = member.nick.lstrip(hoisting_str)
-                try:
-                    await member.edit(nick=new_nick)
-                    hoisters_renamed.append(member)
-                except discord.Forbidden:
-                    failed_renames.append(member)
-                except discord.HTTPException:
-                    failed_renames.append(member)
+        await interaction.response.defer()
+        guild = interaction.guild
+        state = self.get_guild_state(guild.id)
+        if not state["indexed"]:
+            self.build_index(guild)
 
-        # Format the result with diff formatting
-        hoisters_count = len(hoisters_found)
-        renamed_count = len(hoisters_renamed)
-        failed_count = len(failed_renames)
+        if not state["hoisters"]:
+            await interaction.followup.send("```diff\n--- Hoisters found: 0 ---\n```")
+            return
+
+        await interaction.followup.send(f"Dehoisting {len(state['hoisters'])} member(s) in the background...")
+        worker = self.schedule_renames(guild, state["hoisters"])
+        self.bot.loop.create_task(self.report_dehoist(interaction, worker))
+
+    async def report_dehoist(self, interaction, worker):
+        results = await worker
 
+        # Format the result with diff formatting
         result_message = (
-            f"--- Hoisters found: {hoisters_count} ---\n"
-            f"+ Hoisters renamed: {renamed_count}\n"
-            f"- Failed renames: {failed_count}\n"
+            f"--- Hoisters found: {results['found']} ---\n"
+            f"+ Hoisters renamed: {results['renamed']}\n"
+            f"- Failed renames: {results['failed']}\n"
         )
 
         # Send the message back to the user using `diff` formatting
-        await interaction.response.send_message(f"```diff\n{result_message}```", ephemeral=False)
+        try:
+            await interaction.edit_original_response(content=f"```diff\n{result_message}```")
+        except discord.HTTPException:
+            # The interaction token only lives for 15 minutes
+            await interaction.channel.send(f"```diff\n{result_message}```")
+
+    @discord.app_commands.command(name="dehoist_auto", description="Automatically rename hoisters as they appear")
+    @discord.app_commands.checks.has_permissions(moderate_members=True, manage_nicknames=True)
+    async def dehoist_auto(self, interaction: discord.Interaction, enabled: bool):
+        state = self.get_guild_state(interaction.guild.id)
+        state["auto_dehoist"] = enabled
+        self.save_guild_state(interaction.guild.id)
+        if not state["indexed"]:
+            self.build_index(interaction.guild)
+        await interaction.response.send_message(f"Automatic dehoisting has been {'enabled' if enabled else 'disabled'}.")
 
 async def setup(bot):
     await bot.add_cog(AntiHoist(bot))
@@ -1,9 +1,100 @@
 import discord
 from discord import app_commands, ui
-from discord.ext import commands
+from discord.ext import commands, tasks
+from cachetools import TTLCache
 import aiohttp
 import asyncio
+import json
+import os
 import re
+import time
+
+BLACKLIST_API_URL = "http://localhost:5000"
+BANNED_USERS_FILE = "data/banned_users.json"  # Local copy of the blacklist, used until the first sync
+MIRROR_POLL_INTERVAL = 60  # Seconds between polls for blacklist changes
+MIRROR_MAX_AGE = 300  # Seconds after the last successful sync before joins are checked against the API again
+FEED_RETRY_INTERVAL = 3600  # Seconds between polls while the API doesn't serve the snapshot/change feed
+MAX_CONCURRENT_KICKS = 10  # Guilds a blacklisted user is kicked from at the same time
+
+BLACKLIST_CHANNEL_IDS = {123456789012345678}  # Forum channels blacklist requests are posted in, replace with your actual channel ID
+VALIDATION_CACHE_TTL = 3600  # Seconds a thread's parsed request is remembered
+
+# Every field of a blacklist request, matched in one pass over the post
+REQUEST_FIELD_LABEL = (
+    r"(?P<field>Discord username|Discord user ID|Minecraft username|Minecraft UUID|Reason)"
+    r"(?:\s*\(if applicable\))?:"
+)
+# A value follows its label on the same line or, when that line is empty, starts
+# on the next non-blank line as long as that line isn't another field's label
+REQUEST_FIELD_PATTERN = re.compile(
+    REQUEST_FIELD_LABEL
+    + r"[ \t]*(?:\n(?!\s*" + REQUEST_FIELD_LABEL.replace("?P<field>", "?:") + r")\s*)?(?P<value>[^\n]*)",
+    re.IGNORECASE
+)
+REQUEST_FIELDS = {
+    "discord username": "discord_username",
+    "discord user id": "discord_user_id",
+    "minecraft username": "minecraft_username",
+    "minecraft uuid": "minecraft_uuid",
+    "reason": "reason",
+}
+TITLE_PATTERN = re.compile(r'(.*?)\s*\((\d+)\)')
+
+class BlacklistMirror:
+    """In-memory copy of the blacklist API, so joins are checked without a network hop.
+
+    It is kept in sync with one full snapshot followed by polls for changes since the
+    cursor the API handed back, and written to BANNED_USERS_FILE after each change.
+    Until the API serves that feed the mirror stays stale and joins go to the API."""
+
+    def __init__(self, path):
+        self.path = path
+        self.banned = {}  # user_id -> reason
+        self.cursor = None  # Position in the API's change feed, None until a snapshot was loaded
+        self.synced_at = None  # time.monotonic() of the last successful sync
+        try:
+            with open(path, 'r') as f:
+                self.banned = {int(user_id): reason for user_id, reason in json.load(f).items()}
+        except FileNotFoundError:
+            pass
+
+    def is_stale(self):
+        return self.synced_at is None or time.monotonic() - self.synced_at > MIRROR_MAX_AGE
+
+    def get_reason(self, user_id):
+        """The reason a user was blacklisted, or None if they aren't."""
+        return self.banned.get(user_id)
+
+    def add(self, user_id, reason):
+        self.banned[int(user_id)] = reason or "No reason provided"
+
+    def remove(self, user_id):
+        """Forget a user, returns True if they were in the mirror."""
+        return self.banned.pop(int(user_id), None) is not None
+
+    def apply_snapshot(self, data):
+        self.banned = {}
+        for entry in data.get("users", []):
+            self.add(entry["user_id"], entry.get("reason"))
+        self.cursor = data.get("cursor")
+        self.synced_at = time.monotonic()
+
+    def apply_changes(self, data):
+        """Apply a change feed page, returns True if anything changed."""
+        for entry in data.get("added", []):
+            self.add(entry["user_id"], entry.get("reason"))
+        for user_id in data.get("removed", []):
+            self.banned.pop(int(user_id), None)
+        self.cursor = data.get("cursor", self.cursor)
+        self.synced_at = time.monotonic()
+        return bool(data.get("added") or data.get("removed"))
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({str(user_id): reason for user_id, reason in self.banned.items()}, f, indent=4)
+        os.replace(tmp_path, self.path)
 
 class ConfirmButton(ui.View):
     def __init__(self, cog, blacklist_data):
@@ -45,41 +136,33 @@ class ConfirmButton(ui.View):
         
         # Send the blacklist request to the API
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post('http://localhost:5000/blacklist', json=payload) as response:
-                    if response.status != 200:
-                        response_text = await response.text()
-                        print(f"API Error: {response.status} - {response_text}")
-                        await interaction.followup.send(f"Failed to blacklist user. API returned: {response.status}", ephemeral=True)
-                        return
-                    else:
-                        # API request successful
-                        print("Blacklist API request successful")
+            async with self.cog.session.post(f'{BLACKLIST_API_URL}/blacklist', json=payload) as response:
+                if response.status != 200:
+                    response_text = await response.text()
+                    print(f"API Error: {response.status} - {response_text}")
+                    await interaction.followup.send(f"Failed to blacklist user. API returned: {response.status}", ephemeral=True)
+                    return
+                else:
+                    # API request successful
+                    print("Blacklist API request successful")
+                    # Don't wait for the next poll, the user may try to rejoin right away
+                    self.cog.mirror.add(user_id, reason)
+                    self.cog.mirror.save()
         except Exception as e:
             print(f"API request error: {e}")
             await interaction.followup.send(f"Failed to connect to blacklist API: {str(e)}", ephemeral=True)
             return
         
         # Process kicks and notifications
-        kicked_servers = []
-        mutual_servers = []
+        results = await self.cog.enforce_blacklist(int(user_id), reason)  # guild -> outcome
+        results = {guild: outcome for guild, outcome in results.items() if outcome != "not a member"}
+        kicked_servers = [guild.name for guild, outcome in results.items() if outcome == "kicked"]
+        failed_servers = [f"{guild.name} ({outcome})" for guild, outcome in results.items() if outcome != "kicked"]
+        mutual_servers = [guild.name for guild in results]
         
         try:
-            # Get user information
-            user = await self.cog.bot.fetch_user(int(user_id))
-            
-            # Find mutual servers
-            for guild in self.cog.bot.guilds:
-                member = guild.get_member(int(user_id))
-                if member:
-                    mutual_servers.append(guild.name)
-                    try:
-                        await member.kick(reason=f"Blacklisted: {reason}")
-                        kicked_servers.append(guild.name)
-                    except discord.Forbidden:
-                        print(f"Missing permissions to kick from {guild.name}")
-                    except Exception as e:
-                        print(f"Error kicking from {guild.name}: {e}")
+            # Get user information, only going over REST when they aren't cached
+            user = self.cog.bot.get_user(int(user_id)) or await self.cog.bot.fetch_user(int(user_id))
             
             # Try to DM the user
             if mutual_servers:
@@ -102,6 +185,9 @@ class ConfirmButton(ui.View):
             kick_message = f"User {username} ({user_id}) has been blacklisted and kicked from the following servers:\n" + "\n".join(kicked_servers)
         else:
             kick_message = f"User {username} ({user_id}) has been blacklisted, but couldn't be kicked from any servers."
+        if failed_servers:
+            kick_message += "\nCould not kick from:\n" + "\n".join(failed_servers)
+        kick_message = kick_message[:1800]  # Leave room for the Minecraft details below
         
         # Add Minecraft info to message if available
         if self.blacklist_data.get('minecraft_username'):
@@ -133,6 +219,111 @@ class Blacklist(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.AUTHORIZED_USERS = [987323487343493191, 1088268266499231764, 726721909374320640, 710863981039845467, 1151136371164065904]
+        self.mirror = BlacklistMirror(BANNED_USERS_FILE)
+        self.feed_supported = True  # False once the API answered 404 for the snapshot/change feed
+        self.session = None
+        self.member_guilds = {}  # user_id -> set of IDs of guilds they share with the bot
+        self.validated_threads = TTLCache(maxsize=1000, ttl=VALIDATION_CACHE_TTL)  # thread_id -> parsed request or None
+
+    async def cog_load(self):
+        # One pooled session for every request to the blacklist API
+        self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10))
+        self.sync_blacklist.start()
+        if self.bot.is_ready():
+            self.index_members()
+
+    def index_members(self):
+        """Rebuild the user -> mutual guilds index from the member cache."""
+        self.member_guilds = {}
+        for guild in self.bot.guilds:
+            self.index_guild(guild)
+
+    def index_guild(self, guild):
+        for member in guild.members:
+            self.member_guilds.setdefault(member.id, set()).add(guild.id)
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        self.index_members()
+
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild):
+        self.index_guild(guild)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild):
+        for member in guild.members:
+            self.unindex_member(member.id, guild.id)
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member):
+        self.unindex_member(member.id, member.guild.id)
+
+    def unindex_member(self, user_id, guild_id):
+        guild_ids = self.member_guilds.get(user_id)
+        if guild_ids:
+            guild_ids.discard(guild_id)
+            if not guild_ids:
+                del self.member_guilds[user_id]
+
+    async def enforce_blacklist(self, user_id, reason):
+        """Kick a user from every guild they share with the bot, returns {guild: outcome}."""
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_KICKS)
+
+        async def kick(guild):
+            member = guild.get_member(user_id)
+            if member is None:
+                return "not a member"
+            async with semaphore:
+                try:
+                    await member.kick(reason=f"Blacklisted: {reason}")
+                    return "kicked"
+                except discord.Forbidden:
+                    print(f"Missing permissions to kick from {guild.name}")
+                    return "missing permissions"
+                except discord.HTTPException as e:
+                    print(f"Error kicking from {guild.name}: {e}")
+                    return "error"
+
+        guilds = [guild for guild in map(self.bot.get_guild, self.member_guilds.get(user_id, ())) if guild]
+        outcomes = await asyncio.gather(*(kick(guild) for guild in guilds))
+        return dict(zip(guilds, outcomes))
+
+    async def cog_unload(self):
+        self.sync_blacklist.cancel()
+        await self.session.close()
+
+    @tasks.loop(seconds=MIRROR_POLL_INTERVAL)
+    async def sync_blacklist(self):
+        """Refresh the mirror, a full snapshot the first time and only the changes after that."""
+        try:
+            if self.mirror.cursor is None:
+                async with self.session.get(f'{BLACKLIST_API_URL}/blacklist/snapshot') as response:
+                    response.raise_for_status()
+                    self.mirror.apply_snapshot(await response.json())
+                changed = True
+            else:
+                async with self.session.get(f'{BLACKLIST_API_URL}/blacklist/changes', params={'since': self.mirror.cursor}) as response:
+                    response.raise_for_status()
+                    changed = self.mirror.apply_changes(await response.json())
+            if changed:
+                self.mirror.save()
+            if not self.feed_supported:
+                print("Blacklist API now serves the change feed, syncing the mirror again")
+                self.feed_supported = True
+                self.sync_blacklist.change_interval(seconds=MIRROR_POLL_INTERVAL)
+        except aiohttp.ClientResponseError as e:
+            if e.status != 404:
+                print(f"Failed to sync blacklist mirror: {e}")
+            elif self.feed_supported:
+                # Without the feed the mirror never becomes fresh and every join is checked with
+                # the API, so only look for the feed occasionally and say so once
+                print("Blacklist API has no snapshot/change feed, checking joins against the API instead")
+                self.feed_supported = False
+                self.sync_blacklist.change_interval(seconds=FEED_RETRY_INTERVAL)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, KeyError) as e:
+            # Joins fall back to the API once the mirror has gone stale
+            print(f"Failed to sync blacklist mirror: {e}")
 
     def get_correct_format_embed(self):
         embed = discord.Embed(title="Correct Blacklist Request Format", color=discord.Color.blue())
@@ -158,100 +349,119 @@ Reason: Griefing and using hacks"""
 
     @commands.Cog.listener()
     async def on_member_join(self, member):
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f'http://localhost:5000/check_blacklist/{member.id}') as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if data['blacklisted']:
-                        reason = data.get('reason', 'No reason provided')
-                        await member.ban(reason=f"Blacklisted: {reason}")
+        self.member_guilds.setdefault(member.id, set()).add(member.guild.id)
+        reason = self.mirror.get_reason(member.id)
+        if self.mirror.is_stale():
+            # Entries only leave the mirror through the change feed, so without a recent
+            # sync a hit is confirmed with the API too, not just a miss
+            reason = await self.check_blacklist_api(member.id, fallback=reason)
+        if reason is not None:
+            await member.ban(reason=f"Blacklisted: {reason}")
+
+    async def check_blacklist_api(self, user_id, fallback=None):
+        """Ask the API directly, only used while the mirror can't be trusted.
+
+        Returns the blacklist reason or None, and `fallback` if the API can't be reached."""
+        try:
+            async with self.session.get(f'{BLACKLIST_API_URL}/check_blacklist/{user_id}') as response:
+                if response.status != 200:
+                    return fallback
+                data = await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            print(f"Failed to check blacklist for {user_id}: {e}")
+            return fallback
+
+        if data['blacklisted']:
+            reason = data.get('reason', 'No reason provided')
+            self.mirror.add(user_id, reason)
+            return reason
+        if self.mirror.remove(user_id):
+            # Un-blacklisted since the mirror last heard about it
+            self.mirror.save()
+        return None
 
 
     @commands.Cog.listener()
     async def on_thread_create(self, thread):
-        if isinstance(thread.parent, discord.ForumChannel):
-            await asyncio.sleep(1)  # Wait for the initial message to be posted
-            
-            # Get the initial message
-            try:
-                starter_message = await thread.fetch_message(thread.id)
-                
-                # Only process blacklist requests in the appropriate channel
-                blacklist_channel_ids = [123456789012345678]  # Replace with your actual channel ID
-                if thread.parent.id not in blacklist_channel_ids:
-                    return
-                    
-                # Parse the request
-                blacklist_data = self.parse_blacklist_request(starter_message.content)
-                
-                # If parsing failed, send format guidance
-                if not blacklist_data:
-                    correct_format_embed = self.get_correct_format_embed()
-                    await thread.send(embed=correct_format_embed)
-                    return
-                
-                # Create and send the embed for a valid request
-                embed = discord.Embed(title="Blacklist Application", color=discord.Color.orange())
-                embed.add_field(name="Discord Username", value=blacklist_data['discord_username'], inline=False)
-                embed.add_field(name="Discord User ID", value=blacklist_data['discord_user_id'], inline=False)
-                embed.add_field(name="Reason", value=blacklist_data['reason'], inline=False)
-                
-                if blacklist_data.get('minecraft_username'):
-                    embed.add_field(name="Minecraft Username", value=blacklist_data['minecraft_username'], inline=False)
-                if blacklist_data.get('minecraft_uuid'):
-                    embed.add_field(name="Minecraft UUID", value=blacklist_data['minecraft_uuid'], inline=False)
-                
-                # Create and send the confirmation buttons
-                view = ConfirmButton(self, blacklist_data)
-                await thread.send(embed=embed, view=view)
-                
-            except discord.NotFound:
-                print(f"Could not find starter message for thread {thread.id}")
-            except Exception as e:
-                print(f"Error processing thread {thread.id}: {e}")
+        # The starter message is usually created before the thread event arrives, otherwise
+        # on_message picks it up, so there's never a need to wait and fetch it
+        if thread.starter_message is not None:
+            await self.process_request(thread, thread.starter_message)
+
+    @commands.Cog.listener()
+    async def on_message(self, message):
+        # A forum post's starter message shares its ID with the thread
+        thread = message.channel
+        if isinstance(thread, discord.Thread) and message.id == thread.id:
+            await self.process_request(thread, message)
+
+    async def process_request(self, thread, starter_message):
+        # Only process blacklist requests in the appropriate channel
+        if thread.parent_id not in BLACKLIST_CHANNEL_IDS or thread.id in self.validated_threads:
+            return
+
+        # Parse the request
+        blacklist_data = self.parse_blacklist_request(starter_message.content)
+        self.validated_threads[thread.id] = blacklist_data
+
+        try:
+            # If parsing failed, send format guidance
+            if not blacklist_data:
+                correct_format_embed = self.get_correct_format_embed()
+                await thread.send(embed=correct_format_embed)
+                return
+
+            # Create and send the embed for a valid request
+            embed = discord.Embed(title="Blacklist Application", color=discord.Color.orange())
+            embed.add_field(name="Discord Username", value=blacklist_data['discord_username'], inline=False)
+            embed.add_field(name="Discord User ID", value=blacklist_data['discord_user_id'], inline=False)
+            embed.add_field(name="Reason", value=blacklist_data['reason'], inline=False)
+
+            if blacklist_data.get('minecraft_username'):
+                embed.add_field(name="Minecraft Username", value=blacklist_data['minecraft_username'], inline=False)
+            if blacklist_data.get('minecraft_uuid'):
+                embed.add_field(name="Minecraft UUID", value=blacklist_data['minecraft_uuid'], inline=False)
+
+            # Create and send the confirmation buttons
+            view = ConfirmButton(self, blacklist_data)
+            await thread.send(embed=embed, view=view)
+
+        except Exception as e:
+            print(f"Error processing thread {thread.id}: {e}")
 
     def parse_blacklist_request(self, content):
         data = {}
-        
-        # Extract information using regex patterns
-        discord_username_pattern = r"Discord username:\s*([^\n]+)"
-        discord_id_pattern = r"Discord user ID:\s*(\d+)"
-        minecraft_username_pattern = r"Minecraft username(?:\s*\(if applicable\))?:\s*([^\n]+)"
-        minecraft_uuid_pattern = r"Minecraft UUID(?:\s*\(if applicable\))?:\s*([^\n]+)"
-        reason_pattern = r"Reason:\s*([\s\S]+)$"  # Match everything to the end
-        
-        # Extract using regex
-        username_match = re.search(discord_username_pattern, content, re.IGNORECASE)
-        id_match = re.search(discord_id_pattern, content, re.IGNORECASE)
-        mc_username_match = re.search(minecraft_username_pattern, content, re.IGNORECASE)
-        mc_uuid_match = re.search(minecraft_uuid_pattern, content, re.IGNORECASE)
-        reason_match = re.search(reason_pattern, content, re.IGNORECASE)
-        
-        # Populate data if matches found
-        if username_match:
-            data['discord_username'] = username_match.group(1).strip()
-        if id_match:
-            data['discord_user_id'] = id_match.group(1).strip()
-        if mc_username_match:
-            data['minecraft_username'] = mc_username_match.group(1).strip()
-        if mc_uuid_match:
-            data['minecraft_uuid'] = mc_uuid_match.group(1).strip()
-        if reason_match:
-            data['reason'] = reason_match.group(1).strip()
-        
+
+        # Read every field in a single pass, the first occurrence of each one wins
+        for match in REQUEST_FIELD_PATTERN.finditer(content):
+            key = REQUEST_FIELDS[match.group('field').lower()]
+            if key in data:
+                continue
+            if key == 'reason':
+                value = content[match.start('value'):]  # The reason runs to the end of the post
+            elif key == 'discord_user_id':
+                value = (match.group('value').split() or [''])[0]
+                if not value.isdigit():
+                    continue
+            else:
+                value = match.group('value')
+            value = value.strip()
+            if value:
+                data[key] = value
+
         # If we can't extract via regex, try a fallback for thread-title parsing
         if not ('discord_username' in data and 'discord_user_id' in data):
             # Try to extract from thread title format (username (ID))
-            title_match = re.match(r'(.*?)\s*\((\d+)\)', content.split('\n')[0])
+            title_match = TITLE_PATTERN.match(content.split('\n')[0])
             if title_match:
                 data['discord_username'] = title_match.group(1).strip()
                 data['discord_user_id'] = title_match.group(2).strip()
-        
+
         # Check if we have the minimum required data
         if 'discord_username' in data and 'discord_user_id' in data and 'reason' in data:
             return data
         else:
             return None
-            
+
 async def setup(bot):
     await bot.add_cog(Blacklist(bot))
\ No newline at end of file
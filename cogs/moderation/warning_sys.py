@@ -1,51 +1,141 @@
 import discord
 from discord import app_commands
 from discord.ext import commands
+from bisect import bisect_left
 import json
 import os
+import time
 from cogs.moderation.moderation import Moderation
 
+WARNINGS_DIR = 'settings/warnings'
+LEDGER_FILE = os.path.join(WARNINGS_DIR, 'ledger.jsonl')  # Append-only, one warning or clear per line
+DECAY_FILE = os.path.join(WARNINGS_DIR, 'decay.json')  # guild_id -> days after which a warning stops counting
+LEGACY_WARNINGS_FILE = 'warnings.json'  # Old format, a bare count per user
+HISTORY_PAGE_SIZE = 10
+
+class UserWarnings:
+    """Index of one member's warnings in a guild.
+
+    `offsets` points at every warning they ever got in the ledger, for /warnings history.
+    `active` holds the times of the warnings since the last clear, oldest first, so the
+    decayed count is a single bisect."""
+    __slots__ = ("offsets", "active")
+
+    def __init__(self):
+        self.offsets = []
+        self.active = []
+
+    def count(self, now, decay_seconds):
+        if not decay_seconds:
+            return len(self.active)
+        return len(self.active) - bisect_left(self.active, now - decay_seconds)
+
 class WarningSystem(commands.Cog):
     MAX_WARNINGS_BEFORE_KICK = 5  # Number of warnings before a user gets kicked
-    WARNINGS_FILE = 'warnings.json'  # Path to the JSON file
 
     def __init__(self, bot):
         self.bot = bot
-        self.warnings = self.load_warnings()  # Load warnings from the JSON file
-
-    def load_warnings(self):
-        """Load warnings from the JSON file."""
-        if os.path.exists(self.WARNINGS_FILE):
-            with open(self.WARNINGS_FILE, 'r') as f:
-                return json.load(f)
+        self.warnings = {}  # (guild_id, user_id) -> UserWarnings
+        self.decay_days = self.load_decay()
+        self.load_ledger()
+
+    def load_ledger(self):
+        """Index the ledger, migrating the old warnings.json on first run."""
+        os.makedirs(WARNINGS_DIR, exist_ok=True)
+        if not os.path.exists(LEDGER_FILE) and os.path.exists(LEGACY_WARNINGS_FILE):
+            self.migrate_legacy_warnings()
+            return
+        if not os.path.exists(LEDGER_FILE):
+            return
+
+        offset = 0
+        torn_at = None
+        missing_newline = False
+        with open(LEDGER_FILE, 'rb') as f:
+            for line in f:
+                missing_newline = not line.endswith(b"\n")
+                if line.strip():
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        if not line.endswith(b"\n"):
+                            # A crash mid-append leaves a partial last line, drop it below
+                            torn_at = offset
+                            break
+                        print(f"Skipping unreadable warning ledger entry at offset {offset}")
+                    else:
+                        self.index_entry(entry, offset)
+                offset += len(line)
+        if torn_at is not None:
+            print(f"Truncating torn warning ledger entry at offset {torn_at}")
+            with open(LEDGER_FILE, 'r+b') as f:
+                f.truncate(torn_at)
+        elif missing_newline:
+            # The last entry made it but its newline didn't, finish it so the next append starts a new line
+            with open(LEDGER_FILE, 'ab') as f:
+                f.write(b"\n")
+
+    def migrate_legacy_warnings(self):
+        with open(LEGACY_WARNINGS_FILE, 'r') as f:
+            legacy = json.load(f)
+        now = time.time()
+        for guild_id, users in legacy.items():
+            for user_id, count in users.items():
+                for _ in range(count):
+                    self.append_entry({"type": "warn", "guild_id": int(guild_id), "user_id": int(user_id),
+                                       "moderator_id": None, "reason": "Migrated from warnings.json", "time": now})
+        os.replace(LEGACY_WARNINGS_FILE, f"{LEGACY_WARNINGS_FILE}.migrated")
+
+    def index_entry(self, entry, offset):
+        user_warnings = self.warnings.setdefault((entry["guild_id"], entry["user_id"]), UserWarnings())
+        if entry["type"] == "warn":
+            user_warnings.offsets.append(offset)
+            user_warnings.active.append(entry["time"])
+        elif entry["type"] == "clear":
+            user_warnings.active = []
+
+    def append_entry(self, entry):
+        """Append one entry to the ledger and index it, never rewriting what's already there."""
+        with open(LEDGER_FILE, 'ab') as f:
+            f.seek(0, os.SEEK_END)
+            offset = f.tell()
+            f.write(json.dumps(entry).encode() + b"\n")
+        self.index_entry(entry, offset)
+
+    def read_entries(self, offsets):
+        with open(LEDGER_FILE, 'rb') as f:
+            entries = []
+            for offset in offsets:
+                f.seek(offset)
+                entries.append(json.loads(f.readline()))
+            return entries
+
+    def load_decay(self):
+        if os.path.exists(DECAY_FILE):
+            with open(DECAY_FILE, 'r') as f:
+                return {int(guild_id): days for guild_id, days in json.load(f).items()}
         return {}
 
-    def save_warnings(self):
-        """Save warnings to the JSON file."""
-        with open(self.WARNINGS_FILE, 'w') as f:
-            json.dump(self.warnings, f, indent=4)
+    def save_decay(self):
+        os.makedirs(WARNINGS_DIR, exist_ok=True)
+        tmp_path = f"{DECAY_FILE}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({str(guild_id): days for guild_id, days in self.decay_days.items()}, f, indent=4)
+        os.replace(tmp_path, DECAY_FILE)
+
+    def get_warning_count(self, guild_id, user_id):
+        user_warnings = self.warnings.get((guild_id, user_id))
+        if user_warnings is None:
+            return 0
+        return user_warnings.count(time.time(), self.decay_days.get(guild_id, 0) * 86400)
 
     @app_commands.command(name='warn', description="Warn a user")
     @app_commands.checks.has_permissions(manage_messages=True)
     async def warn(self, interaction: discord.Interaction, member: discord.Member, reason: str = None):
         """Warn a user and send them a DM. Kick them if warnings exceed a threshold."""
-        guild_id = str(interaction.guild.id)  # Store as string for JSON compatibility
-        user_id = str(member.id)
-
-        # Initialize warnings for the guild if it doesn't exist
-        if guild_id not in self.warnings:
-            self.warnings[guild_id] = {}
-
-        # Initialize warnings for the user if they don't exist
-        if user_id not in self.warnings[guild_id]:
-            self.warnings[guild_id][user_id] = 0
-
-        # Increment the user's warnings
-        self.warnings[guild_id][user_id] += 1
-        warning_count = self.warnings[guild_id][user_id]
-
-        # Save the updated warnings to the file
-        self.save_warnings()
+        self.append_entry({"type": "warn", "guild_id": interaction.guild.id, "user_id": member.id,
+                           "moderator_id": interaction.user.id, "reason": reason, "time": time.time()})
+        warning_count = self.get_warning_count(interaction.guild.id, member.id)
 
         # Send a DM to the user
         try:
@@ -62,34 +152,64 @@ class WarningSystem(commands.Cog):
             except discord.Forbidden:
                 await interaction.followup.send(f"I don't have permission to kick {member.mention}.", ephemeral=True)
 
-    
-    @app_commands.command(name='warnings', description="Check warnings of a user")
-    async def warnings(self, interaction: discord.Interaction, member: discord.Member):
-        """Check the number of warnings a user has."""
-        guild_id = str(interaction.guild.id)
-        user_id = str(member.id)
+    warnings_group = app_commands.Group(name='warnings', description="View and configure warnings")
 
-        if guild_id in self.warnings and user_id in self.warnings[guild_id]:
-            count = self.warnings[guild_id][user_id]
+    @warnings_group.command(name='check', description="Check warnings of a user")
+    async def check_warnings(self, interaction: discord.Interaction, member: discord.Member):
+        """Check the number of warnings a user has."""
+        count = self.get_warning_count(interaction.guild.id, member.id)
+        if count:
             await interaction.response.send_message(f"{member.mention} has {count} warning(s).")
         else:
             await interaction.response.send_message(f"{member.mention} has no warnings.")
 
+    @warnings_group.command(name='history', description="List every warning a user has received")
+    @app_commands.describe(page="Page to show, newest warnings first")
+    async def warning_history(self, interaction: discord.Interaction, member: discord.Member, page: int = 1):
+        user_warnings = self.warnings.get((interaction.guild.id, member.id))
+        if user_warnings is None or not user_warnings.offsets:
+            await interaction.response.send_message(f"{member.mention} has never been warned.")
+            return
+
+        total = len(user_warnings.offsets)
+        pages = (total + HISTORY_PAGE_SIZE - 1) // HISTORY_PAGE_SIZE
+        page = min(max(page, 1), pages)
+        # Only this page's entries are read from the ledger
+        end = total - (page - 1) * HISTORY_PAGE_SIZE
+        offsets = user_warnings.offsets[max(end - HISTORY_PAGE_SIZE, 0):end]
+
+        embed = discord.Embed(title=f"Warnings for {member.display_name}", color=discord.Color.orange())
+        for number, entry in zip(range(end, 0, -1), reversed(self.read_entries(offsets))):
+            moderator = f"<@{entry['moderator_id']}>" if entry["moderator_id"] else "Unknown"
+            embed.add_field(
+                name=f"#{number} - <t:{int(entry['time'])}:f>",
+                value=f"Reason: {entry['reason'] or 'No reason provided.'}\nModerator: {moderator}",
+                inline=False
+            )
+        embed.set_footer(text=f"Page {page}/{pages} - {total} warning(s) in total")
+        await interaction.response.send_message(embed=embed)
+
+    @warnings_group.command(name='decay', description="Stop counting warnings after a number of days")
+    @app_commands.describe(days="Days a warning counts toward a kick, 0 to never expire")
+    @app_commands.checks.has_permissions(manage_guild=True)
+    async def set_decay(self, interaction: discord.Interaction, days: app_commands.Range[int, 0, 3650]):
+        if days:
+            self.decay_days[interaction.guild.id] = days
+        else:
+            self.decay_days.pop(interaction.guild.id, None)
+        self.save_decay()
+        if days:
+            await interaction.response.send_message(f"Warnings now stop counting after {days} day(s).")
+        else:
+            await interaction.response.send_message("Warnings no longer expire.")
+
     @app_commands.command(name='clear_warnings', description="Clear warnings for a user")
     @app_commands.checks.has_permissions(manage_messages=True)
     async def clear_warnings(self, interaction: discord.Interaction, member: discord.Member):
-        """Clear all warnings for a user."""
-        guild_id = str(interaction.guild.id)
-        user_id = str(member.id)
-
-        if guild_id in self.warnings and user_id in self.warnings[guild_id]:
-            del self.warnings[guild_id][user_id]
-            # If no users remain in the guild, remove the guild entry
-            if not self.warnings[guild_id]:
-                del self.warnings[guild_id]
-
-            # Save the updated warnings to the file
-            self.save_warnings()
+        """Clear all warnings for a user, their history is kept."""
+        if self.get_warning_count(interaction.guild.id, member.id):
+            self.append_entry({"type": "clear", "guild_id": interaction.guild.id, "user_id": member.id,
+                               "moderator_id": interaction.user.id, "time": time.time()})
             await interaction.response.send_message(f"Cleared all warnings for {member.mention}.")
         else:
             await interaction.response.send_message(f"{member.mention} has no warnings to clear.")
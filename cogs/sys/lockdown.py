@@ -1,89 +1,294 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
+from pathlib import Path
+import asyncio
 import datetime
+import json
+import logging
+import time
+
+# Directory where lockdown snapshots and in-progress jobs are stored
+LOCKDOWN_STATE_DIR = Path("settings/lockdown")
+
+# @everyone permissions that are denied while the server is locked
+LOCKDOWN_PERMISSIONS = (
+    "send_messages",
+    "add_reactions",
+    "create_public_threads",
+    "create_private_threads",
+    "send_messages_in_threads",
+)
+
+# Snapshots store one character per permission above: allow, deny or unset
+OVERWRITE_CODES = {True: "a", False: "d", None: "-"}
+OVERWRITE_VALUES = {code: value for value, code in OVERWRITE_CODES.items()}
+LOCKED_CODE = OVERWRITE_CODES[False] * len(LOCKDOWN_PERMISSIONS)
+
+# Channel permission edits are bucketed per channel by Discord, so a handful of
+# concurrent edits stays well under the global limit while still being fast
+MAX_CONCURRENT_EDITS = 5
+PROGRESS_INTERVAL = 2.0  # Seconds between progress updates / state checkpoints
+
+logger = logging.getLogger(__name__)
+
+def encode_overwrite(overwrite):
+    """Compact the lockdown-relevant part of an overwrite into a short string."""
+    return "".join(OVERWRITE_CODES[getattr(overwrite, perm)] for perm in LOCKDOWN_PERMISSIONS)
+
+def decode_overwrite(code):
+    return {perm: OVERWRITE_VALUES[char] for perm, char in zip(LOCKDOWN_PERMISSIONS, code)}
+
+def load_lockdown_state(guild_id):
+    state_file = LOCKDOWN_STATE_DIR / f"{guild_id}.json"
+    if state_file.exists():
+        with open(state_file, "r") as file:
+            return json.load(file)
+    return None
+
+def save_lockdown_state(guild_id, state):
+    LOCKDOWN_STATE_DIR.mkdir(parents=True, exist_ok=True)
+    state_file = LOCKDOWN_STATE_DIR / f"{guild_id}.json"
+    tmp_file = state_file.with_suffix(".tmp")
+    with open(tmp_file, "w") as file:
+        json.dump(state, file)
+    tmp_file.replace(state_file)
+
+def clear_lockdown_state(guild_id):
+    state_file = LOCKDOWN_STATE_DIR / f"{guild_id}.json"
+    if state_file.exists():
+        state_file.unlink()
 
 class ServerLockdown(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.running_jobs = {}  # guild_id -> asyncio.Task of the lockdown being applied
+
+    async def cog_load(self):
+        self.bot.loop.create_task(self.resume_pending_lockdowns())
+
+    def cog_unload(self):
+        # Unfinished jobs keep their state file and are resumed on the next load
+        for task in self.running_jobs.values():
+            task.cancel()
 
     # Command group for lockdown commands
     lockdown = app_commands.Group(name="lockdown", description="Server lockdown commands")
 
+    def get_lockdown_channels(self, guild):
+        """Get all channels excluding ticket channels and categories"""
+        return [ch for ch in guild.channels
+                if not isinstance(ch, discord.CategoryChannel)
+                and "ticket" not in ch.name.lower()]
+
     @lockdown.command(name="toggle", description="Lock or unlock the server")
     @commands.has_permissions(administrator=True)
     @app_commands.describe(state="Whether to lock or unlock the server (true = lock, false = unlock)")
     async def toggle_lockdown(self, interaction: discord.Interaction, state: bool):
         """Toggle server lockdown state"""
         guild = interaction.guild
-        
-        # Define permissions to be modified
-        lockdown_overwrites = {
-            guild.default_role: discord.PermissionOverwrite(
-                send_messages=False,
-                add_reactions=False,
-                create_public_threads=False,
-                create_private_threads=False,
-                send_messages_in_threads=False
+        action = "locked" if state else "unlocked"
+
+        # These checks only read the state file, so they answer before deferring and can stay ephemeral
+        if guild.id in self.running_jobs:
+            await interaction.response.send_message(
+                "A lockdown change is already in progress for this server, please wait for it to finish.",
+                ephemeral=True
             )
-        }
-        
-        unlock_overwrites = {
-            guild.default_role: discord.PermissionOverwrite(
-                send_messages=None,  # Reset to default
-                add_reactions=None,
-                create_public_threads=None,
-                create_private_threads=None,
-                send_messages_in_threads=None
+            return
+
+        lockdown_state = load_lockdown_state(guild.id) or {"locked": False, "snapshot": {}}
+        job = lockdown_state.get("job")
+        resuming = job is not None and job["state"] == state
+        if not resuming and lockdown_state["locked"] == state:
+            await interaction.response.send_message(f"The server is already {action}.", ephemeral=True)
+            return
+
+        # Hold the guild's slot while deferring so a second toggle can't slip in meanwhile,
+        # applying overwrites can take longer than the 3 second window
+        self.running_jobs[guild.id] = asyncio.current_task()
+        try:
+            await interaction.response.defer()
+            if resuming:
+                # An earlier run of this same change was cut short, finish it rather than report it as done
+                logger.info(f"Resuming lockdown job for guild {guild.id} ({len(job['pending'])} channels left)")
+            else:
+                self.prepare_lockdown_job(guild, lockdown_state, state, interaction.user)
+        except BaseException:
+            del self.running_jobs[guild.id]
+            raise
+
+        try:
+            failed = await self.run_lockdown_job(guild, lockdown_state, interaction)
+        except Exception as e:
+            logger.error(f"Lockdown job failed for guild {guild.id}: {e}")
+            await interaction.edit_original_response(content=f"Failed to {action} server: {str(e)}")
+            return
+
+        # Send confirmation, channels that failed mean the change only partly went through
+        if failed:
+            title = f"Server Partially {action.capitalize()}"
+            description = (
+                f"The server has been partially {action} by {interaction.user.mention}. "
+                f"{len(failed)} channel(s) could not be updated"
+                + ("" if state else " and are still locked, run the unlock again to retry them") + "."
+            )
+        else:
+            title = f"Server {action.capitalize()}"
+            description = f"The server has been {action} by {interaction.user.mention}"
+        embed = discord.Embed(
+            title=title,
+            description=description,
+            color=discord.Color.red() if state else discord.Color.green(),
+            timestamp=datetime.datetime.now()
+        )
+        if failed:
+            embed.add_field(
+                name="Could not update",
+                value=" ".join(f"<#{channel_id}>" for channel_id in failed)[:1024],
+                inline=False
             )
+        embed.set_footer(text=f"Action performed by {interaction.user}")
+
+        await interaction.edit_original_response(content=None, embed=embed)
+
+        # Optional: Log the action to a moderation log channel
+        log_channel_id = await self.get_mod_log_channel(guild)
+        if log_channel_id:
+            log_channel = guild.get_channel(log_channel_id)
+            if log_channel:
+                await log_channel.send(embed=embed)
+
+    def prepare_lockdown_job(self, guild, lockdown_state, state, actor):
+        """Record a new lock or unlock job in the state file before any channel is touched."""
+        if state:
+            # Snapshot the prior @everyone state of every channel the lockdown will change
+            snapshot = {}
+            for channel in self.get_lockdown_channels(guild):
+                prior = encode_overwrite(channel.overwrites_for(guild.default_role))
+                if prior != LOCKED_CODE:
+                    snapshot[str(channel.id)] = prior
+            lockdown_state["snapshot"] = snapshot
+        lockdown_state["locked"] = state
+        lockdown_state["job"] = {
+            "state": state,
+            "actor": str(actor),
+            "pending": [int(channel_id) for channel_id in lockdown_state["snapshot"]],
+            "failed": [],
         }
+        save_lockdown_state(guild.id, lockdown_state)
+
+    async def run_lockdown_job(self, guild, lockdown_state, interaction=None):
+        """Apply the pending lockdown job, checkpointing its progress so it can be resumed.
 
+        Returns the IDs of channels that could not be modified."""
+        task = asyncio.current_task()
+        self.running_jobs[guild.id] = task
         try:
-            # Get all channels excluding ticket channels and categories
-            channels = [ch for ch in guild.channels 
-                       if not isinstance(ch, discord.CategoryChannel) 
-                       and "ticket" not in ch.name.lower()]
+            return await self.apply_lockdown_job(guild, lockdown_state, interaction)
+        finally:
+            if self.running_jobs.get(guild.id) is task:
+                del self.running_jobs[guild.id]
 
-            # Apply the appropriate overwrites based on state
-            target_overwrites = lockdown_overwrites if state else unlock_overwrites
-            action = "locked" if state else "unlocked"
+    async def apply_lockdown_job(self, guild, lockdown_state, interaction):
+        job = lockdown_state["job"]
+        snapshot = lockdown_state["snapshot"]
+        state = job["state"]
+        action = "locked" if state else "unlocked"
+        reason = f"Server {action} by {job['actor']}"
 
-            for channel in channels:
+        pending = set(job["pending"])
+        failed = set(job["failed"])
+        total = len(pending) + len(failed)
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_EDITS)
+        last_checkpoint = time.monotonic()
+
+        async def apply(channel_id):
+            channel = guild.get_channel(channel_id)
+            if channel is not None:
+                # Locking denies everything, unlocking restores what the snapshot recorded
+                target = LOCKED_CODE if state else snapshot[str(channel_id)]
+                overwrite = channel.overwrites_for(guild.default_role)
+                if encode_overwrite(overwrite) != target:
+                    # Only touch the @everyone overwrite, other roles and members are left alone
+                    overwrite.update(**decode_overwrite(target))
+                    async with semaphore:
+                        try:
+                            await channel.set_permissions(
+                                guild.default_role,
+                                overwrite=None if overwrite.is_empty() else overwrite,
+                                reason=reason
+                            )
+                        except discord.NotFound:
+                            pass  # Deleted mid-run, nothing left to lock or restore
+                        except discord.HTTPException as e:
+                            # One bad channel must not abort the rest of the job
+                            logger.warning(f"Failed to update channel {channel_id} in guild {guild.id}: {e}")
+                            failed.add(channel_id)
+            pending.discard(channel_id)
+
+        def save_progress():
+            job["pending"] = list(pending)
+            job["failed"] = list(failed)
+            save_lockdown_state(guild.id, lockdown_state)
+
+        async def checkpoint():
+            save_progress()
+            if interaction is not None:
+                done = total - len(pending)
                 try:
-                    await channel.edit(
-                        overwrites={**channel.overwrites, **target_overwrites},
-                        reason=f"Server {action} by {interaction.user}"
+                    await interaction.edit_original_response(
+                        content=f"Server is being {action}... {done}/{total} channels processed."
                     )
-                except discord.Forbidden:
-                    await interaction.channel.send(
-                        f"Missing permissions to modify {channel.mention}",
-                        ephemeral=True
-                    )
-                    continue
-
-            # Send confirmation
-            embed = discord.Embed(
-                title=f"Server {action.capitalize()}",
-                description=f"The server has been {action} by {interaction.user.mention}",
-                color=discord.Color.red() if state else discord.Color.green(),
-                timestamp=datetime.datetime.now()
-            )
-            embed.set_footer(text=f"Action performed by {interaction.user}")
+                except discord.HTTPException:
+                    pass  # The interaction token may have expired, the job keeps going
 
-            await interaction.response.send_message(embed=embed)
+        tasks = [asyncio.ensure_future(apply(channel_id)) for channel_id in list(pending)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                await next_done
+                if time.monotonic() - last_checkpoint >= PROGRESS_INTERVAL:
+                    last_checkpoint = time.monotonic()
+                    await checkpoint()
+        except BaseException:
+            for t in tasks:
+                t.cancel()
+            save_progress()
+            raise
 
-            # Optional: Log the action to a moderation log channel
-            log_channel_id = await self.get_mod_log_channel(guild)
-            if log_channel_id:
-                log_channel = guild.get_channel(log_channel_id)
-                if log_channel:
-                    await log_channel.send(embed=embed)
+        del lockdown_state["job"]
+        if state:
+            # Channels we could not lock keep their own state, so there is nothing to restore
+            for channel_id in failed:
+                snapshot.pop(str(channel_id), None)
+            save_lockdown_state(guild.id, lockdown_state)
+        elif failed:
+            # Keep the snapshot for channels still locked so a later unlock can retry them
+            lockdown_state["locked"] = True
+            lockdown_state["snapshot"] = {str(channel_id): snapshot[str(channel_id)] for channel_id in failed}
+            save_lockdown_state(guild.id, lockdown_state)
+        else:
+            clear_lockdown_state(guild.id)
+        return sorted(failed)
 
-        except Exception as e:
-            await interaction.response.send_message(
-                f"Failed to {action} server: {str(e)}",
-                ephemeral=True
-            )
+    async def resume_pending_lockdowns(self):
+        """Roll forward any lockdown jobs interrupted by a crash or restart."""
+        await self.bot.wait_until_ready()
+        if not LOCKDOWN_STATE_DIR.exists():
+            return
+        for state_file in LOCKDOWN_STATE_DIR.glob("*.json"):
+            guild = self.bot.get_guild(int(state_file.stem))
+            if guild is None or guild.id in self.running_jobs:
+                continue
+            lockdown_state = load_lockdown_state(guild.id)
+            if not lockdown_state or "job" not in lockdown_state:
+                continue
+            job = lockdown_state["job"]
+            logger.info(f"Resuming lockdown job for guild {guild.id} ({len(job['pending'])} channels left)")
+            try:
+                await self.run_lockdown_job(guild, lockdown_state)
+            except Exception as e:
+                logger.error(f"Failed to resume lockdown job for guild {guild.id}: {e}")
 
     async def get_mod_log_channel(self, guild):
         """Placeholder method to get moderation log channel ID
@@ -96,21 +301,18 @@ class ServerLockdown(commands.Cog):
     async def lockdown_status(self, interaction: discord.Interaction):
         """Check if the server is currently locked down"""
         guild = interaction.guild
-        is_locked = False
-        
-        # Check a sample channel's permissions
-        for channel in guild.text_channels:
-            if "ticket" not in channel.name.lower():
-                perms = channel.overwrites_for(guild.default_role)
-                if perms.send_messages is False:
-                    is_locked = True
-                    break
+        lockdown_state = load_lockdown_state(guild.id)
+        is_locked = bool(lockdown_state and lockdown_state["locked"])
 
         embed = discord.Embed(
             title="Server Lockdown Status",
             description=f"The server is currently {'**locked**' if is_locked else '**unlocked**'}",
             color=discord.Color.red() if is_locked else discord.Color.green()
         )
+        if is_locked:
+            embed.add_field(name="Locked channels", value=str(len(lockdown_state["snapshot"])))
+        if guild.id in self.running_jobs or (lockdown_state and "job" in lockdown_state):
+            embed.add_field(name="In progress", value="A lockdown change is currently being applied.")
         await interaction.response.send_message(embed=embed, ephemeral=True)
 
     @commands.Cog.listener()
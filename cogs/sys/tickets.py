@@ -1,4 +1,6 @@
 import discord
+import asyncio
+import gzip
 import json
 from discord.ext import commands
 from discord import app_commands
@@ -8,25 +10,271 @@ import logging
 # Path to the directory where guild settings will be stored
 GUILD_SETTINGS_DIR = Path("settings/ticket_settings")
 
+# Path to the registry of open tickets
+TICKET_REGISTRY_FILE = Path("settings/ticket_registry.json")
+
+# Transcripts are written here while they are being exported, then uploaded to the log channel
+TRANSCRIPT_DIR = Path("settings/ticket_transcripts")
+TRANSCRIPT_WORKERS = 2  # Tickets exported at the same time
+TRANSCRIPT_BATCH = 100  # Messages buffered before they are compressed and written
+
 # Ensure the directory exists
 GUILD_SETTINGS_DIR.mkdir(parents=True, exist_ok=True)
+TRANSCRIPT_DIR.mkdir(parents=True, exist_ok=True)
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Settings are read on every ticket button click, so each guild's file is only parsed once
+guild_settings_cache = {}  # guild_id -> settings dict
+
 # Load and save functions
 def load_guild_settings(guild_id):
-    guild_settings_file = GUILD_SETTINGS_DIR / f"{guild_id}.json"
-    if guild_settings_file.exists():
-        with open(guild_settings_file, "r") as file:
-            return json.load(file)
-    return {}
+    settings = guild_settings_cache.get(guild_id)
+    if settings is None:
+        guild_settings_file = GUILD_SETTINGS_DIR / f"{guild_id}.json"
+        if guild_settings_file.exists():
+            with open(guild_settings_file, "r") as file:
+                settings = json.load(file)
+        else:
+            settings = {}
+        guild_settings_cache[guild_id] = settings
+    return settings
 
 def save_guild_settings(guild_id, data):
     guild_settings_file = GUILD_SETTINGS_DIR / f"{guild_id}.json"
     with open(guild_settings_file, "w") as file:
         json.dump(data, file, indent=4)
+    guild_settings_cache[guild_id] = data
+    ticket_templates.pop(guild_id, None)
+
+# Everything about a new ticket channel that doesn't depend on who opened it, built once per guild.
+# Dropped whenever the guild's settings, roles or categories change.
+ticket_templates = {}  # guild_id -> {"overwrites": {...}, "category": CategoryChannel, "welcome": str}
+
+def get_ticket_template(guild):
+    template = ticket_templates.get(guild.id)
+    if template is None:
+        settings = load_guild_settings(guild.id)
+        overwrites = {
+            guild.default_role: discord.PermissionOverwrite(view_channel=False),
+            guild.me: discord.PermissionOverwrite(view_channel=True, send_messages=True),
+        }
+        for role_id in settings.get("allowed_roles", []):
+            role = guild.get_role(role_id)
+            if role:
+                overwrites[role] = discord.PermissionOverwrite(view_channel=True)
+
+        category_id = settings.get("category_id")
+        category = discord.utils.get(guild.categories, id=category_id) if category_id else None
+
+        role_mentions = [role.mention for role in map(guild.get_role, settings.get("roles_to_ping", [])) if role]
+        if role_mentions:
+            welcome = f"welcome to your ticket! {' '.join(role_mentions)} will assist you shortly."
+        else:
+            welcome = "welcome to your ticket! Staff will assist you shortly."
+
+        template = ticket_templates[guild.id] = {"overwrites": overwrites, "category": category, "welcome": welcome}
+    return template
+
+class TicketRegistry:
+    """Open tickets keyed by (guild, user, topic), with a reverse index from channel to owner.
+
+    Replaces looking tickets up by channel name, which was a scan of every channel
+    and broke as soon as a ticket channel or its owner was renamed."""
+
+    def __init__(self, path):
+        self.path = path
+        self.tickets = {}  # (guild_id, user_id, topic) -> channel_id
+        self.owners = {}  # channel_id -> (guild_id, user_id, topic)
+        self.pending = set()  # (guild_id, user_id, topic) whose channel is still being created
+        if path.exists():
+            with open(path, "r") as file:
+                for guild_id, user_id, topic, channel_id in json.load(file):
+                    self.tickets[(guild_id, user_id, topic)] = channel_id
+                    self.owners[channel_id] = (guild_id, user_id, topic)
+
+    def save(self):
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w") as file:
+            json.dump([[*key, channel_id] for key, channel_id in self.tickets.items()], file)
+        tmp_path.replace(self.path)
+
+    def get_channel_id(self, guild_id, user_id, topic):
+        return self.tickets.get((guild_id, user_id, topic))
+
+    def get_owner_id(self, channel_id):
+        key = self.owners.get(channel_id)
+        return key[1] if key else None
+
+    def reserve(self, guild_id, user_id, topic):
+        """Claim a ticket slot before its channel exists, returns False if one is already being created."""
+        key = (guild_id, user_id, topic)
+        if key in self.pending:
+            return False
+        self.pending.add(key)
+        return True
+
+    def release(self, guild_id, user_id, topic):
+        self.pending.discard((guild_id, user_id, topic))
+
+    def register(self, guild_id, user_id, topic, channel_id):
+        key = (guild_id, user_id, topic)
+        self.tickets[key] = channel_id
+        self.owners[channel_id] = key
+        self.save()
+
+    def unregister_channel(self, channel_id):
+        """Forget a ticket channel, returns True if it was registered."""
+        key = self.owners.pop(channel_id, None)
+        if key is None:
+            return False
+        if self.tickets.get(key) == channel_id:
+            del self.tickets[key]
+        self.save()
+        return True
+
+ticket_registry = TicketRegistry(TICKET_REGISTRY_FILE)
+
+class TranscriptExporter:
+    """Worker pool that streams ticket channels into gzipped JSONL transcripts.
+
+    History is read page by page and written in batches, so a ticket's messages
+    are never all held in memory, and the interaction that closed it never waits."""
+
+    def __init__(self, workers=TRANSCRIPT_WORKERS):
+        self.queue = asyncio.Queue()  # (channel, closed_by)
+        self.pending = {}  # channel_id -> (channel, delete_after) of every queued or running job
+        self.worker_count = workers
+        self.workers = []
+
+    def start(self):
+        self.workers = [asyncio.create_task(self.worker()) for _ in range(self.worker_count)]
+
+    async def stop(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+        # Whoever closed these was told it would happen, so say it didn't
+        for channel, _ in list(self.pending.values()):
+            await self.report_failure(channel, "Closing this ticket was interrupted by a restart before the transcript was saved.")
+        self.pending.clear()
+
+    def submit(self, channel, closed_by, delete_after=False):
+        """Queue a channel's export, returns False if that export was already asked for.
+
+        Deleting a channel whose export is already queued or running (after archiving it)
+        is folded into that job, a second delete is a duplicate."""
+        job = self.pending.get(channel.id)
+        if job is not None:
+            already_deleting = job[1]
+            self.pending[channel.id] = (channel, already_deleting or delete_after)
+            return not already_deleting and delete_after
+        self.pending[channel.id] = (channel, delete_after)
+        self.queue.put_nowait((channel, closed_by))
+        return True
+
+    async def worker(self):
+        while True:
+            channel, closed_by = await self.queue.get()
+            try:
+                await self.export(channel, closed_by)
+            except Exception as e:
+                # Keep the channel around rather than lose the only copy of the conversation
+                del self.pending[channel.id]
+                logger.error(f"Failed to export transcript for channel {channel.id}: {e}")
+                await self.report_failure(channel, f"The transcript of this ticket could not be saved ({e}).")
+                continue
+            if self.pending[channel.id][1]:
+                try:
+                    await channel.delete(reason="Ticket closed")
+                    ticket_registry.unregister_channel(channel.id)
+                except discord.HTTPException as e:
+                    del self.pending[channel.id]
+                    logger.error(f"Failed to delete ticket channel {channel.id} after export: {e}")
+                    await self.report_failure(channel, f"The transcript was saved, but this ticket could not be deleted ({e}).")
+                    continue
+            del self.pending[channel.id]
+
+    async def report_failure(self, channel, notice):
+        """Tell the ticket and the log channel that closing it didn't go through."""
+        log_channel = channel.guild.get_channel(load_guild_settings(channel.guild.id).get("transcript_channel_id"))
+        for target, content in ((channel, f"{notice} The channel has been kept, please try closing it again."),
+                                (log_channel, f"Closing `#{channel.name}` failed: {notice}")):
+            if target is None:
+                continue
+            try:
+                await target.send(content, allowed_mentions=discord.AllowedMentions.none())
+            except discord.HTTPException as e:
+                logger.error(f"Failed to post transcript failure notice in channel {target.id}: {e}")
+
+    async def export(self, channel, closed_by):
+        log_channel = channel.guild.get_channel(load_guild_settings(channel.guild.id).get("transcript_channel_id"))
+        if log_channel is None:
+            raise RuntimeError("transcript channel is not set or no longer exists")
+
+        # Large tickets are split into parts that each fit the guild's upload limit,
+        # with headroom for what the compressor is still buffering
+        part_limit = int(channel.guild.filesize_limit * 0.9)
+        part_files = []
+        message_count = 0
+        lines = []
+        raw = file = None
+
+        def open_part():
+            nonlocal raw, file
+            part_file = TRANSCRIPT_DIR / f"{channel.guild.id}-{channel.id}-{len(part_files) + 1}.jsonl.gz"
+            part_files.append(part_file)
+            raw = open(part_file, "wb")
+            file = gzip.GzipFile(fileobj=raw, mode="wb")
+
+        def close_part():
+            file.close()
+            raw.close()
+
+        def write_lines():
+            nonlocal message_count
+            if raw.tell() >= part_limit:
+                close_part()
+                open_part()
+            file.write(("\n".join(lines) + "\n").encode("utf-8"))
+            message_count += len(lines)
+            lines.clear()
+
+        try:
+            open_part()
+            try:
+                async for message in channel.history(limit=None, oldest_first=True):
+                    lines.append(json.dumps({
+                        "id": message.id,
+                        "author_id": message.author.id,
+                        "author": str(message.author),
+                        "created_at": message.created_at.isoformat(),
+                        "content": message.content,
+                        "attachments": [attachment.url for attachment in message.attachments],
+                        "embeds": [embed.to_dict() for embed in message.embeds],
+                    }))
+                    if len(lines) >= TRANSCRIPT_BATCH:
+                        write_lines()
+                if lines:
+                    write_lines()
+            finally:
+                close_part()
+
+            for number, part_file in enumerate(part_files, start=1):
+                part_label = f", part {number}/{len(part_files)}" if len(part_files) > 1 else ""
+                suffix = f"-{number}" if len(part_files) > 1 else ""
+                await log_channel.send(
+                    f"Transcript of `#{channel.name}` ({message_count} messages{part_label}), closed by {closed_by.mention}.",
+                    file=discord.File(part_file, filename=f"{channel.name}{suffix}.jsonl.gz"),
+                    allowed_mentions=discord.AllowedMentions.none()
+                )
+            logger.info(f"Exported {message_count} messages from ticket channel {channel.id} in {len(part_files)} file(s)")
+        finally:
+            for part_file in part_files:
+                part_file.unlink(missing_ok=True)
 
 # Button and View classes
 class TicketButton(discord.ui.Button):
@@ -38,43 +286,55 @@ class TicketButton(discord.ui.Button):
         logger.info(f"TicketButton callback triggered for guild: {interaction.guild.id}, user: {interaction.user.id}, topic: {self.topic}")
         guild = interaction.guild
         user = interaction.user
-        settings = load_guild_settings(guild.id)
-        allowed_roles = settings.get("allowed_roles", [])
-        roles_to_ping = settings.get("roles_to_ping", [])
-        category_id = settings.get("category_id")
 
-        existing_channel = discord.utils.get(guild.text_channels, name=f"{self.topic}-ticket-{user.name.lower()}")
-        if existing_channel:
-            await interaction.response.send_message(f"You already have a ticket open: {existing_channel.mention}", ephemeral=True)
+        existing_channel_id = ticket_registry.get_channel_id(guild.id, user.id, self.topic)
+        if existing_channel_id:
+            existing_channel = guild.get_channel(existing_channel_id)
+            if existing_channel:
+                await interaction.response.send_message(f"You already have a ticket open: {existing_channel.mention}", ephemeral=True)
+                return
+            # The channel is gone without us noticing, drop the stale entry
+            ticket_registry.unregister_channel(existing_channel_id)
+
+        # Double clicks during a rush would otherwise each create a channel
+        if not ticket_registry.reserve(guild.id, user.id, self.topic):
+            await interaction.response.send_message("Your ticket is already being created.", ephemeral=True)
             return
 
-        overwrites = {
-            guild.default_role: discord.PermissionOverwrite(view_channel=False),
-            user: discord.PermissionOverwrite(view_channel=True, send_messages=True),
-            guild.me: discord.PermissionOverwrite(view_channel=True, send_messages=True),
-        }
-
-        for role_id in allowed_roles:
-            role = guild.get_role(role_id)
-            if role:
-                overwrites[role] = discord.PermissionOverwrite(view_channel=True)
-        
-        category = discord.utils.get(guild.categories, id=category_id) if category_id else None
-
-        ticket_channel = await guild.create_text_channel(
-            name=f"{self.topic}-ticket-{user.name.lower()}",
-            topic=self.topic,
-            overwrites=overwrites,
-            category=category
+        try:
+            # Acknowledge right away, channel creation can take a while when Discord is busy
+            await interaction.response.defer(ephemeral=True, thinking=True)
+            template = get_ticket_template(guild)
+            overwrites = {**template["overwrites"], user: discord.PermissionOverwrite(view_channel=True, send_messages=True)}
+            ticket_channel = await guild.create_text_channel(
+                name=f"{self.topic}-ticket-{user.name.lower()}",
+                topic=self.topic,
+                overwrites=overwrites,
+                category=template["category"]
+            )
+            ticket_registry.register(guild.id, user.id, self.topic, ticket_channel.id)
+        except discord.HTTPException as e:
+            logger.error(f"Failed to create ticket channel in guild {guild.id}: {e}")
+            # Only an interaction that was deferred can still be answered
+            if interaction.response.is_done():
+                try:
+                    await interaction.followup.send("Failed to create your ticket, please try again later.", ephemeral=True)
+                except discord.HTTPException:
+                    pass
+            return
+        finally:
+            ticket_registry.release(guild.id, user.id, self.topic)
+
+        # The welcome message and the reply to the user don't depend on each other
+        welcome_result, reply_result = await asyncio.gather(
+            ticket_channel.send(f"{user.mention}, {template['welcome']}"),
+            interaction.followup.send(f"Ticket created: {ticket_channel.mention}", ephemeral=True),
+            return_exceptions=True
         )
-
-        if roles_to_ping:
-            role_mentions = [guild.get_role(role_id).mention for role_id in roles_to_ping if guild.get_role(role_id)]
-            await ticket_channel.send(f"{user.mention}, welcome to your ticket! {' '.join(role_mentions)} will assist you shortly.")
-        else:
-            await ticket_channel.send(f"{user.mention}, welcome to your ticket! Staff will assist you shortly.")
-
-        await interaction.response.send_message(f"Ticket created: {ticket_channel.mention}", ephemeral=True)
+        if isinstance(welcome_result, Exception):
+            logger.error(f"Failed to send the welcome message in ticket channel {ticket_channel.id}: {welcome_result}")
+        if isinstance(reply_result, Exception):
+            logger.error(f"Failed to confirm ticket {ticket_channel.id} to user {user.id}: {reply_result}")
 
 class TicketView(discord.ui.View):
     def __init__(self, guild_id):
@@ -96,23 +356,61 @@ class TicketSystem(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.registered_views = {}  # Dictionary to track registered TicketView instances by guild ID
+        self.transcripts = TranscriptExporter()
 
     # Command group for tickets
     tickets = app_commands.Group(name="tickets", description="Ticket system commands")
-    
+
+    async def cog_load(self):
+        self.transcripts.start()
+        # Persistent views are only needed for guilds that have ticket buttons configured
+        for guild_settings_file in GUILD_SETTINGS_DIR.glob("*.json"):
+            guild_id = int(guild_settings_file.stem)
+            if load_guild_settings(guild_id).get("tickets"):
+                self.register_view(guild_id)
+        logger.info(f"Registered TicketView for {len(self.registered_views)} guild(s)")
+
+    async def cog_unload(self):
+        await self.transcripts.stop()
+
+    def register_view(self, guild_id):
+        """Build the guild's TicketView from its current settings and (re)register it."""
+        view = TicketView(guild_id)
+        self.bot.add_view(view)
+        self.registered_views[guild_id] = view
+        return view
+
+    @commands.Cog.listener()
+    async def on_guild_role_create(self, role):
+        ticket_templates.pop(role.guild.id, None)
+
+    @commands.Cog.listener()
+    async def on_guild_role_update(self, before, after):
+        ticket_templates.pop(after.guild.id, None)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role):
+        ticket_templates.pop(role.guild.id, None)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel):
+        if isinstance(channel, discord.CategoryChannel):
+            ticket_templates.pop(channel.guild.id, None)
+        if ticket_registry.unregister_channel(channel.id):
+            logger.info(f"Removed deleted ticket channel {channel.id} from the registry")
+
     @commands.Cog.listener()
     async def on_guild_remove(self, guild):
         if guild.id in self.registered_views:
             del self.registered_views[guild.id]
+            ticket_templates.pop(guild.id, None)
             logger.info(f"Removed TicketView for guild {guild.id} after leaving the guild")
 
     @tickets.command(name="open", description="Open the ticket panel")
     async def open_ticket(self, interaction: discord.Interaction):
-        view = TicketView(interaction.guild.id)
-        # Register the view if not already registered
-        if interaction.guild.id not in self.registered_views:
-            self.bot.add_view(view)
-            self.registered_views[interaction.guild.id] = view
+        view = self.registered_views.get(interaction.guild.id)
+        if view is None:
+            view = self.register_view(interaction.guild.id)
             logger.info(f"Registered TicketView for guild: {interaction.guild.id} via /open command")
         await interaction.response.send_message("Select the type of ticket you want to open:", view=view, ephemeral=True)
 
@@ -130,6 +428,8 @@ class TicketSystem(commands.Cog):
             "topic": topic
         })
         save_guild_settings(interaction.guild.id, settings)
+        if interaction.guild.id in self.registered_views:
+            self.register_view(interaction.guild.id)
         await interaction.response.send_message(f"Ticket button '{label}' added for the topic '{topic}'.", ephemeral=True)
 
     @tickets.command(name="set_category", description="Set the category for ticket channels")
@@ -219,7 +519,7 @@ class TicketSystem(commands.Cog):
         await message.delete()
 
         # Create a new message with the same content, embeds, and TicketView
-        view = TicketView(interaction.guild.id)
+        view = self.register_view(interaction.guild.id)
         try:
             if message_embeds:
                 logger.info("Sending new message with embed")
@@ -243,14 +543,6 @@ class TicketSystem(commands.Cog):
             await interaction.followup.send(f"Failed to send the new message with embed: {str(e)}", ephemeral=True)
             return
 
-        # Register the view if not already registered
-        if interaction.guild.id not in self.registered_views:
-            self.bot.add_view(view)
-            self.registered_views[interaction.guild.id] = view
-            logger.info(f"Registered TicketView for guild: {interaction.guild.id} via /place_buttons command")
-        else:
-            logger.info(f"TicketView already registered for guild: {interaction.guild.id}, skipping registration")
-
         # Save the message ID in the settings
         logger.info(f"Saving new message ID to settings: {sent_message.id}")
         settings = load_guild_settings(interaction.guild.id)
@@ -288,15 +580,8 @@ class TicketSystem(commands.Cog):
         settings["tickets"].remove(ticket)
         save_guild_settings(interaction.guild.id, settings)
 
-        # Update the registered view for this guild
-        if interaction.guild.id in self.registered_views:
-            del self.registered_views[interaction.guild.id]  # Remove the old view
-            logger.info(f"Removed old TicketView for guild: {interaction.guild.id}")
-
-        # Create and register a new view with the updated buttons
-        view = TicketView(interaction.guild.id)
-        self.bot.add_view(view)
-        self.registered_views[interaction.guild.id] = view
+        # Replace the registered view with one built from the updated buttons
+        view = self.register_view(interaction.guild.id)
         logger.info(f"Registered updated TicketView for guild: {interaction.guild.id} after removing button")
 
         # Refresh the message that had the buttons
@@ -318,10 +603,25 @@ class TicketSystem(commands.Cog):
         save_guild_settings(interaction.guild.id, settings)
         await interaction.response.send_message(f"Archive category set to {category.name}.", ephemeral=True)
 
+    @tickets.command(name="set_transcript_channel", description="Set the channel transcripts of closed tickets are posted to")
+    @commands.has_permissions(administrator=True)
+    async def set_transcript_channel(self, interaction: discord.Interaction, channel: discord.TextChannel):
+        settings = load_guild_settings(interaction.guild.id)
+        settings["transcript_channel_id"] = channel.id
+        save_guild_settings(interaction.guild.id, settings)
+        await interaction.response.send_message(f"Ticket transcripts will be posted in {channel.mention}.", ephemeral=True)
+
+    def has_transcript_channel(self, guild):
+        return guild.get_channel(load_guild_settings(guild.id).get("transcript_channel_id")) is not None
+
     @tickets.command(name="archive", description="Archive the current ticket")
     @commands.has_permissions(manage_channels=True)
     async def archive_ticket(self, interaction: discord.Interaction):
-        if "ticket" not in interaction.channel.name:
+        await self.archive_channel(interaction)
+
+    async def archive_channel(self, interaction: discord.Interaction):
+        owner_id = ticket_registry.get_owner_id(interaction.channel.id)
+        if owner_id is None and "ticket" not in interaction.channel.name:
             await interaction.response.send_message("This is not a ticket channel.", ephemeral=True)
             return
     
@@ -330,9 +630,13 @@ class TicketSystem(commands.Cog):
         allowed_roles = settings.get("allowed_roles", [])
         archive_category_id = settings.get("archive_category_id")
         
-        # Get the user who created the ticket from the channel name
-        ticket_creator_name = interaction.channel.name.split('-')[-1]
-        ticket_creator = discord.utils.get(guild.members, name=ticket_creator_name)
+        # Get the user who created the ticket
+        if owner_id is not None:
+            ticket_creator = guild.get_member(owner_id)
+        else:
+            # Tickets opened before the registry existed only have the channel name to go on
+            ticket_creator_name = interaction.channel.name.split('-')[-1]
+            ticket_creator = discord.utils.get(guild.members, name=ticket_creator_name)
         
         # New permission overwrites for archived channel
         overwrites = {
@@ -369,14 +673,18 @@ class TicketSystem(commands.Cog):
                 overwrites=overwrites,
                 reason="Ticket archived"
             )
+            # An archived ticket no longer counts as open, so its owner can open a new one
+            ticket_registry.unregister_channel(interaction.channel.id)
             await interaction.channel.send("This ticket has been archived. Only staff can view it now, and only administrators can send messages.")
             await interaction.response.send_message("Ticket has been archived.", ephemeral=True)
+            if self.has_transcript_channel(guild):
+                self.transcripts.submit(interaction.channel, interaction.user)
         except Exception as e:
             await interaction.response.send_message(f"Failed to archive ticket: {str(e)}", ephemeral=True)
 
     @tickets.command(name="close", description="Close the current ticket")
     async def close_ticket(self, interaction: discord.Interaction):
-        if "ticket" not in interaction.channel.name:
+        if ticket_registry.get_owner_id(interaction.channel.id) is None and "ticket" not in interaction.channel.name:
             await interaction.response.send_message("This is not a ticket channel.", ephemeral=True)
             return
 
@@ -387,13 +695,21 @@ class TicketSystem(commands.Cog):
             
             @discord.ui.button(label="Archive", style=discord.ButtonStyle.primary)
             async def archive_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-                await self.cog.archive_ticket(interaction)
+                await self.cog.archive_channel(interaction)
                 self.stop()
                 
             @discord.ui.button(label="Delete", style=discord.ButtonStyle.danger)
             async def delete_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-                await interaction.channel.delete(reason="Ticket closed")
                 self.stop()
+                if self.cog.has_transcript_channel(interaction.guild):
+                    # The exporter deletes and unregisters the channel once the transcript has been uploaded
+                    if self.cog.transcripts.submit(interaction.channel, interaction.user, delete_after=True):
+                        await interaction.response.send_message("Saving the transcript, this channel will be deleted shortly.")
+                    else:
+                        await interaction.response.send_message("This ticket is already being deleted.", ephemeral=True)
+                    return
+                await interaction.channel.delete(reason="Ticket closed")
+                ticket_registry.unregister_channel(interaction.channel.id)
 
         view = CloseOptionsView()
         view.cog = self  # Pass the cog instance to the view